@@ -0,0 +1,55 @@
+"""
+Per-operation counters for database queries and Redis commands.
+"""
+from collections import Counter
+import fakeredis
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+
+class CountingRedis(fakeredis.FakeRedis):
+    """
+    In-memory Redis that counts every command sent to it, including the
+    ones queued on pipelines
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.commands = Counter()
+
+    def execute_command(self, *args, **options):
+        self.commands[str(args[0]).upper()] += 1
+        return super().execute_command(*args, **options)
+
+    def pipeline(self, transaction=True, shard_hint=None):
+        pipe = super().pipeline(transaction=transaction, shard_hint=shard_hint)
+        execute = pipe.execute
+
+        def counted_execute(raise_on_error=True):
+            for args, _ in pipe.command_stack:
+                self.commands[str(args[0]).upper()] += 1
+            return execute(raise_on_error)
+
+        pipe.execute = counted_execute
+        return pipe
+
+
+class Measure:
+    """
+    Context manager recording the queries and Redis commands issued inside it
+    """
+    def __init__(self, redis_client):
+        self.redis_client = redis_client
+        self.queries = 0
+        self.redis_commands = Counter()
+
+    def __enter__(self):
+        self._queries = CaptureQueriesContext(connection)
+        self._queries.__enter__()
+        self._redis_before = Counter(self.redis_client.commands)
+        return self
+
+    def __exit__(self, *exc_info):
+        self._queries.__exit__(*exc_info)
+        self.queries = len(self._queries.captured_queries)
+        self.redis_commands = self.redis_client.commands - self._redis_before
+        return False
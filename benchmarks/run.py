@@ -0,0 +1,274 @@
+"""
+Benchmark the async CRUD pipeline end to end, in-process.
+
+    python -m benchmarks.run --iterations 50 --output bench.json
+    BENCH_DATABASE=postgres python -m benchmarks.run --baseline bench.json
+
+Requests go through the Django test client, tasks run eagerly as they are
+published, and Redis is fakeredis, so each operation is measured from the
+HTTP request to the task reaching DONE. For every scenario the results record
+latency, throughput, and the database queries and Redis commands issued per
+operation. With --baseline, a scenario issuing more queries or Redis commands
+than the baseline run is reported and the exit status is 1.
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+import uuid
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'benchmarks.settings')
+
+import django  # noqa: E402
+django.setup()
+
+from django.db import connection  # noqa: E402
+from django.test import Client  # noqa: E402
+from django.test.utils import override_settings, setup_test_environment, teardown_test_environment  # noqa: E402
+from django.utils import timezone  # noqa: E402
+from celery_worker_app import redis_client  # noqa: E402
+from celery_worker_app.models import Task  # noqa: E402
+from user_app.work import WORK_PROFILES  # noqa: E402
+from user_app.models import User  # noqa: E402
+from .counters import CountingRedis, Measure  # noqa: E402
+
+STATUS_POLL_LIMIT = 100
+
+
+class Bench:
+    """
+    Shared state for one benchmark run
+    """
+    def __init__(self, redis):
+        self.client = Client()
+        self.redis = redis
+
+    def measure(self, operation):
+        """
+        Run operation once, returning its timing and counters
+        """
+        with Measure(self.redis) as measured:
+            started = time.perf_counter()
+            operation()
+            elapsed = time.perf_counter() - started
+        return {
+            "seconds": elapsed,
+            "queries": measured.queries,
+            "redis_commands": measured.redis_commands,
+        }
+
+    def wait_for_task(self, response):
+        """
+        Poll the status endpoint of the task behind a 202 response until it
+        finishes, the way a client would
+        """
+        assert response.status_code == 202, response.content
+        status_url = response.json()["status_endpoint"]
+        for _ in range(STATUS_POLL_LIMIT):
+            data = self.client.get(status_url).json()
+            if data["status"] in ("DONE", "FAILED"):
+                assert data["status"] == "DONE", data
+                return data
+        raise AssertionError(f"{status_url} did not finish")
+
+    def make_user(self):
+        suffix = uuid.uuid4().hex[:12]
+        return User.objects.create(username=f"bench-{suffix}", email=f"bench-{suffix}@example.com")
+
+
+def new_user_payload():
+    suffix = uuid.uuid4().hex[:12]
+    return json.dumps({"username": f"bench-{suffix}", "email": f"bench-{suffix}@example.com"})
+
+
+def bench_create_user(bench, iterations):
+    def operation():
+        bench.wait_for_task(bench.client.post(
+            "/api/users/", new_user_payload(), content_type="application/json"
+        ))
+    return [bench.measure(operation) for _ in range(iterations)]
+
+
+def bench_update_user(bench, iterations):
+    samples = []
+    for i in range(iterations):
+        user = bench.make_user()
+        payload = json.dumps({"first_name": f"Bench {i}"})
+        samples.append(bench.measure(lambda: bench.wait_for_task(bench.client.patch(
+            f"/api/users/{user.id}/", payload, content_type="application/json"
+        ))))
+    return samples
+
+
+def bench_delete_user(bench, iterations):
+    samples = []
+    for _ in range(iterations):
+        user = bench.make_user()
+        samples.append(bench.measure(lambda: bench.wait_for_task(
+            bench.client.delete(f"/api/users/{user.id}/")
+        )))
+    return samples
+
+
+def bench_get_user_async(bench, iterations):
+    user = bench.make_user()
+    return [
+        bench.measure(lambda: bench.wait_for_task(bench.client.get(f"/api/users/{user.id}/?sync=0")))
+        for _ in range(iterations)
+    ]
+
+
+def bench_get_user_sync(bench, iterations):
+    user = bench.make_user()
+
+    def operation():
+        response = bench.client.get(f"/api/users/{user.id}/?sync=1")
+        assert response.status_code == 200, response.content
+    return [bench.measure(operation) for _ in range(iterations)]
+
+
+def bench_task_status(bench, iterations):
+    task = Task.objects.create(task_name="benchmark", status="DONE", result={"progress": 100},
+                               dispatched_at=timezone.now())
+
+    def operation():
+        response = bench.client.get(f"/api/tasks/{task.id}/status/")
+        assert response.status_code == 200, response.content
+    return [bench.measure(operation) for _ in range(iterations)]
+
+
+def bench_task_list(bench, iterations):
+    def operation():
+        response = bench.client.get("/api/tasks/?page_size=50")
+        assert response.status_code == 200, response.content
+    return [bench.measure(operation) for _ in range(iterations)]
+
+
+SCENARIOS = {
+    "create_user": bench_create_user,
+    "update_user": bench_update_user,
+    "delete_user": bench_delete_user,
+    "get_user_async": bench_get_user_async,
+    "get_user_sync": bench_get_user_sync,
+    "task_status": bench_task_status,
+    "task_list": bench_task_list,
+}
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+def summarize(samples):
+    latencies = [s["seconds"] * 1000 for s in samples]
+    queries = [s["queries"] for s in samples]
+    redis_totals = [sum(s["redis_commands"].values()) for s in samples]
+    redis_by_command = {}
+    for sample in samples:
+        for command, count in sample["redis_commands"].items():
+            redis_by_command[command] = redis_by_command.get(command, 0) + count
+
+    return {
+        "iterations": len(samples),
+        "requests_per_sec": round(len(samples) / sum(s["seconds"] for s in samples), 1),
+        "latency_ms": {
+            "mean": round(statistics.mean(latencies), 3),
+            "p50": round(percentile(latencies, 0.5), 3),
+            "p95": round(percentile(latencies, 0.95), 3),
+            "max": round(max(latencies), 3),
+        },
+        "queries_per_op": {"mean": round(statistics.mean(queries), 2), "max": max(queries)},
+        "redis_commands_per_op": {
+            "mean": round(statistics.mean(redis_totals), 2),
+            "max": max(redis_totals),
+            "by_command": {
+                command: round(count / len(samples), 2)
+                for command, count in sorted(redis_by_command.items())
+            },
+        },
+    }
+
+
+def regressions(results, baseline):
+    """
+    Scenarios issuing more queries or Redis commands per operation than in
+    the baseline results
+    """
+    found = []
+    for name, current in results["scenarios"].items():
+        previous = baseline.get("scenarios", {}).get(name)
+        if previous is None:
+            continue
+        for metric in ("queries_per_op", "redis_commands_per_op"):
+            if current[metric]["max"] > previous[metric]["max"]:
+                found.append(
+                    f"{name}: {metric} max {previous[metric]['max']} -> {current[metric]['max']}"
+                )
+    return found
+
+
+def run(redis, scenarios, iterations, work_profile='off'):
+    bench = Bench(redis)
+
+    # With the default 'off' work profile latency reflects the pipeline's own
+    # overhead rather than the tasks' simulated processing time
+    with override_settings(USER_TASK_WORK_PROFILE=work_profile):
+        return {
+            "meta": {
+                "timestamp": timezone.now().isoformat(),
+                "database": connection.vendor,
+                "python": platform.python_version(),
+                "django": django.get_version(),
+                "iterations": iterations,
+                "work_profile": work_profile,
+            },
+            "scenarios": {
+                name: summarize(SCENARIOS[name](bench, iterations)) for name in scenarios
+            },
+        }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the async CRUD pipeline")
+    parser.add_argument("--iterations", type=int, default=50)
+    parser.add_argument("--scenario", action="append", choices=sorted(SCENARIOS),
+                        help="Scenario to run (repeatable, default: all)")
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    parser.add_argument("--baseline", help="Fail if queries or Redis commands grew against this results file")
+    parser.add_argument("--work-profile", choices=WORK_PROFILES, default="off",
+                        help="USER_TASK_WORK_PROFILE for the tasks (default: off)")
+    args = parser.parse_args(argv)
+
+    # Installed first so nothing, not even test database setup, reaches a real Redis
+    redis = CountingRedis()
+    redis_client._client = redis
+
+    setup_test_environment()
+    old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    try:
+        results = run(redis, args.scenario or list(SCENARIOS), args.iterations, args.work_profile)
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        teardown_test_environment()
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    print(output)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            found = regressions(results, json.load(f))
+        for line in found:
+            print(f"REGRESSION {line}", file=sys.stderr)
+        return 1 if found else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,26 @@
+"""
+Settings for the benchmark suite (python -m benchmarks.run).
+
+The project settings with Celery running tasks eagerly in-process. The
+database is SQLite unless BENCH_DATABASE=postgres, which keeps the project's
+PostgreSQL settings; either way the runner works in a throwaway test
+database. Redis is swapped for fakeredis by the runner.
+"""
+import os
+from task_project.settings import *  # noqa: F401,F403
+from task_project.settings import BASE_DIR
+
+ALLOWED_HOSTS = ['*']
+
+CELERY_TASK_ALWAYS_EAGER = True
+CELERY_TASK_EAGER_PROPAGATES = False
+CELERY_BROKER_URL = 'memory://'
+CELERY_RESULT_BACKEND = 'cache+memory://'
+
+if os.environ.get('BENCH_DATABASE', 'sqlite') == 'sqlite':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': BASE_DIR / 'bench.sqlite3',
+        }
+    }
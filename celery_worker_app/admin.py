@@ -3,7 +3,7 @@ from .models import Task
 
 @admin.register(Task)
 class TaskAdmin(admin.ModelAdmin):
-    list_display = ('id', 'task_name', 'status', 'related_table', 'related_id', 'operation', 'created_at', 'updated_at', 'get_progress')
+    list_display = ('id', 'task_name', 'status', 'related_table', 'related_id', 'operation', 'client_id', 'queue_wait_ms', 'created_at', 'updated_at', 'get_progress')
     list_filter = ('status', 'task_name', 'related_table', 'operation')
-    search_fields = ('id', 'task_name', 'related_id')
+    search_fields = ('id', 'task_name', 'related_id', 'client_id')
     readonly_fields = ('id', 'created_at', 'updated_at')
\ No newline at end of file
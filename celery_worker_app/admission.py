@@ -0,0 +1,74 @@
+"""
+Admission control: when the queues are saturated, refuse new tasks straight
+away instead of accepting work that would only wait.
+
+dispatch.enqueue checks every new task against a cached backlog snapshot
+(backlog.py):
+
+    its queue at TASK_ADMISSION_QUEUE_HARD_LIMIT messages,
+    or TASK_ADMISSION_PENDING_LIMIT PENDING tasks       503 for everyone
+    its queue at TASK_ADMISSION_QUEUE_SOFT_LIMIT        429 for clients over
+                                                        their rate (fairness.py)
+
+Both carry Retry-After: TASK_ADMISSION_RETRY_AFTER seconds. A limit of 0 is
+off. Requests answered with an existing task (idempotency.py) are always
+admitted, since they add no work.
+
+User reads have a cheaper way out: while their queue is deep they are
+answered inline (see queue_backlogged and user_app/views.py).
+"""
+from django.conf import settings
+from rest_framework import status
+from rest_framework.exceptions import APIException
+from .backlog import queue_for, snapshot
+from .metrics import TASKS_REJECTED
+
+
+class Overloaded(APIException):
+    """
+    Rendered by DRF as the status code with a Retry-After header (from wait)
+    """
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = "Too much work is queued, try again later."
+    default_code = 'overloaded'
+
+    def __init__(self, wait, detail=None, status_code=None):
+        super().__init__(detail)
+        self.wait = wait
+        if status_code is not None:
+            self.status_code = status_code
+
+
+def _reject(task_name, status_code, detail):
+    TASKS_REJECTED.labels(task_name, status_code).inc()
+    raise Overloaded(settings.TASK_ADMISSION_RETRY_AFTER, detail, status_code)
+
+
+def admit(task_name, throttled=False):
+    """
+    Raise Overloaded if a new task_name should not be queued now. throttled
+    says whether the requesting client is over its rate.
+    """
+    backlog = snapshot()
+    queue = queue_for(task_name)
+    depth = backlog["queues"].get(queue, 0)
+    hard_limit = settings.TASK_ADMISSION_QUEUE_HARD_LIMIT
+    pending_limit = settings.TASK_ADMISSION_PENDING_LIMIT
+    soft_limit = settings.TASK_ADMISSION_QUEUE_SOFT_LIMIT
+
+    if hard_limit and depth >= hard_limit:
+        _reject(task_name, status.HTTP_503_SERVICE_UNAVAILABLE,
+                f"The {queue} queue is full, try again later.")
+    if pending_limit and (backlog["pending"] or 0) >= pending_limit:
+        _reject(task_name, status.HTTP_503_SERVICE_UNAVAILABLE,
+                "Too many tasks are waiting, try again later.")
+    if throttled and soft_limit and depth >= soft_limit:
+        _reject(task_name, status.HTTP_429_TOO_MANY_REQUESTS,
+                f"The {queue} queue is busy and you are over your task rate, try again later.")
+
+
+def queue_backlogged(task_name, depth):
+    """
+    True if task_name's queue holds at least depth messages (never for 0)
+    """
+    return bool(depth) and snapshot()["queues"].get(queue_for(task_name), 0) >= depth
@@ -4,3 +4,13 @@ from django.apps import AppConfig
 class CeleryWorkerAppConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'celery_worker_app'
+
+    def ready(self):
+        # Connect the Celery signal handlers that own Task status transitions
+        from . import signals  # noqa: F401
+        # Per-process database connection statistics
+        from . import db_connections  # noqa: F401
+        # Frees deduplication keys once their task finishes
+        from . import idempotency  # noqa: F401
+        # Task timings and counts for Prometheus
+        from . import metrics  # noqa: F401
@@ -0,0 +1,126 @@
+"""
+How much work is waiting: broker queue lengths and unfinished Task rows.
+
+Reading them costs a Redis round trip and a count query, so callers
+(admission.py, the metrics collector) use snapshot(), which each process
+refreshes at most every TASK_ADMISSION_CACHE_SECONDS. Only unfinished rows
+are counted, which the status index keeps cheap; finished ones are estimated
+from PostgreSQL's planner statistics instead of counted across the whole
+retention window.
+"""
+import logging
+import time
+import redis
+from celery import current_app
+from django.conf import settings
+from django.db import DatabaseError, connection
+from django.db.models import Count
+from redis.exceptions import RedisError
+from .models import ACTIVE_STATUSES, Task
+from .partitions import PARENT_TABLE
+from .redis_client import client_options
+
+logger = logging.getLogger(__name__)
+
+_broker = None
+_snapshot = None
+
+
+def queue_names():
+    names = {current_app.conf.task_default_queue}
+    names.update(route['queue'] for route in settings.CELERY_TASK_ROUTES.values() if 'queue' in route)
+    return sorted(names)
+
+
+def queue_for(task_name):
+    """
+    The broker queue task_name is routed to (see CELERY_TASK_ROUTES)
+    """
+    return current_app.amqp.router.route({}, task_name)['queue'].name
+
+
+def queue_lengths():
+    """
+    {queue: messages waiting} for every queue tasks are routed to; empty
+    unless the broker is Redis
+    """
+    global _broker
+    if not settings.CELERY_BROKER_URL.startswith(('redis://', 'rediss://')):
+        return {}
+    if _broker is None:
+        _broker = redis.Redis.from_url(settings.CELERY_BROKER_URL, **client_options())
+    # With priorities, Redis keeps one list per priority step ("writes:3")
+    options = settings.CELERY_BROKER_TRANSPORT_OPTIONS
+    sep = options.get('sep', ':')
+    steps = options.get('priority_steps', [0])
+    queues = queue_names()
+    pipe = _broker.pipeline(transaction=False)
+    for queue in queues:
+        for step in steps:
+            pipe.llen(f"{queue}{sep}{step}" if step else queue)
+    lengths = pipe.execute()
+    return {queue: sum(lengths[i * len(steps):(i + 1) * len(steps)]) for i, queue in enumerate(queues)}
+
+
+def active_counts():
+    """
+    {status: Task rows} for the unfinished statuses
+    """
+    counts = dict(
+        Task.objects.filter(status__in=ACTIVE_STATUSES)
+        .values_list('status').annotate(n=Count('id')).order_by()
+    )
+    return {status: counts.get(status, 0) for status in ACTIVE_STATUSES}
+
+
+def estimated_counts():
+    """
+    {status: estimated Task rows}, from the row estimates and status
+    frequencies ANALYZE keeps for the table (each partition on its own). Empty
+    off PostgreSQL; tables not analyzed yet are missing from it.
+    """
+    if connection.vendor != 'postgresql':
+        return {}
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT mcv.status, SUM(c.reltuples * mcv.freq)
+            FROM pg_class c
+            JOIN pg_namespace n ON n.oid = c.relnamespace
+            JOIN pg_stats s ON s.schemaname = n.nspname AND s.tablename = c.relname
+                AND s.attname = 'status' AND NOT s.inherited
+            CROSS JOIN LATERAL unnest(s.most_common_vals::text::text[], s.most_common_freqs)
+                AS mcv(status, freq)
+            WHERE c.relkind = 'r' AND c.reltuples > 0
+              AND (c.relname = %s OR c.oid IN (
+                  SELECT inhrelid FROM pg_inherits WHERE inhparent = %s::regclass))
+            GROUP BY mcv.status
+            """,
+            [PARENT_TABLE, PARENT_TABLE]
+        )
+        return {status: round(rows) for status, rows in cursor.fetchall()}
+
+
+def snapshot():
+    """
+    {"queues": {queue: length}, "active": {status: count}, "pending": count},
+    at most TASK_ADMISSION_CACHE_SECONDS old. A part that cannot be read is
+    left empty ({} or None) rather than failing the caller.
+    """
+    global _snapshot
+    now = time.monotonic()
+    if _snapshot is not None and now - _snapshot[0] < settings.TASK_ADMISSION_CACHE_SECONDS:
+        return _snapshot[1]
+
+    value = {"queues": {}, "active": {}, "pending": None}
+    try:
+        value["queues"] = queue_lengths()
+    except RedisError as e:
+        logger.warning(f"Could not read queue lengths: {e}")
+    try:
+        value["active"] = active_counts()
+        value["pending"] = value["active"]["PENDING"]
+    except DatabaseError as e:
+        logger.warning(f"Could not count pending tasks: {e}")
+    _snapshot = (now, value)
+    return value
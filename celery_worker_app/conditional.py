@@ -0,0 +1,61 @@
+"""
+Conditional GETs (ETag / If-None-Match) for the read endpoints.
+
+A task's representation only changes when its row does, so its ETag comes
+from updated_at and can be checked without loading the row's JSON. Other
+responses (user reads, batch statuses) are tagged with a hash of their
+content, which saves the transfer to clients that already have it.
+
+Finished tasks never change again, so they may be cached for
+TASK_TERMINAL_CACHE_SECONDS; everything else must be revalidated.
+"""
+import hashlib
+import json
+from django.conf import settings
+from django.utils.http import parse_etags, quote_etag
+from rest_framework import status
+from rest_framework.response import Response
+from .events import TERMINAL_STATUSES
+
+
+def version_etag(updated_at):
+    return quote_etag(f"{updated_at.timestamp():.6f}")
+
+
+def content_etag(data):
+    return quote_etag(hashlib.sha1(json.dumps(data, sort_keys=True, default=str).encode()).hexdigest())
+
+
+def is_fresh(request, etag):
+    """
+    True if the client's If-None-Match says it already has etag
+    """
+    etags = parse_etags(request.headers.get("If-None-Match", ""))
+    return "*" in etags or etag in etags
+
+
+def task_cache_control(task_status):
+    if task_status in TERMINAL_STATUSES:
+        return f"public, max-age={settings.TASK_TERMINAL_CACHE_SECONDS}"
+    return "no-cache"
+
+
+def not_modified(etag, cache_control="no-cache"):
+    return Response(status=status.HTTP_304_NOT_MODIFIED,
+                    headers={"ETag": etag, "Cache-Control": cache_control})
+
+
+def tagged(response, etag, cache_control="no-cache"):
+    response["ETag"] = etag
+    response["Cache-Control"] = cache_control
+    return response
+
+
+def conditional_response(request, data):
+    """
+    200 with data, or an empty 304 if the client's copy is identical
+    """
+    etag = content_etag(data)
+    if is_fresh(request, etag):
+        return not_modified(etag)
+    return tagged(Response(data), etag)
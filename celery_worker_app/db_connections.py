@@ -0,0 +1,119 @@
+"""
+Per-process database connection statistics.
+
+With persistent connections (CONN_MAX_AGE) a process should open a handful
+of connections and then reuse them; a process that keeps opening new ones
+is misconfigured or being cut off. Every web and worker process counts the
+connections it opens and closes and reports them to Redis after a request
+or task, at most every DB_CONNECTION_STATS_INTERVAL seconds, where
+`manage.py connection_stats` reads them back. Opening a connection is only
+counted, so management commands never talk to Redis for this.
+
+Celery's Django fixup already drops connections inherited across the worker
+fork and keeps each pool process's own connections between tasks (closing
+them only once unusable or older than CONN_MAX_AGE); worker_process_init
+here only starts the child's counters afresh.
+"""
+import json
+import logging
+import os
+import socket
+import time
+import weakref
+from celery.signals import task_postrun, worker_init, worker_process_init
+from django.conf import settings
+from django.core.signals import request_finished
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from redis.exceptions import RedisError
+from .redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+STATS_KEY = "db:connections:{}"
+
+
+class ConnectionStats:
+    def __init__(self, role):
+        self.role = role
+        self.process = f"{socket.gethostname()}:{os.getpid()}"
+        self.started = time.time()
+        self.opened = 0
+        self._wrappers = weakref.WeakSet()
+        self._last_report = 0.0
+
+    def record_open(self, wrapper):
+        self.opened += 1
+        self._wrappers.add(wrapper)
+
+    def open_now(self):
+        return sum(1 for wrapper in list(self._wrappers) if wrapper.connection is not None)
+
+    def snapshot(self):
+        open_now = self.open_now()
+        minutes = max((time.time() - self.started) / 60, 1 / 60)
+        return {
+            "process": self.process,
+            "role": self.role,
+            "started": int(self.started),
+            "opened": self.opened,
+            "closed": self.opened - open_now,
+            "open": open_now,
+            "opened_per_min": round(self.opened / minutes, 2),
+            "closed_per_min": round((self.opened - open_now) / minutes, 2),
+        }
+
+    def report(self):
+        """
+        Store the snapshot in Redis if the reporting interval has passed
+        """
+        interval = settings.DB_CONNECTION_STATS_INTERVAL
+        now = time.monotonic()
+        if now - self._last_report < interval:
+            return
+        self._last_report = now
+        try:
+            get_redis().set(STATS_KEY.format(self.process), json.dumps(self.snapshot()),
+                            ex=max(interval * 4, 60))
+        except RedisError as e:
+            logger.warning(f"Could not report connection stats for {self.process}: {e}")
+
+
+stats = ConnectionStats(role="web")
+
+
+def read_all():
+    """
+    The latest snapshot from every live process, busiest first
+    """
+    client = get_redis()
+    keys = list(client.scan_iter(STATS_KEY.format("*"), count=500))
+    snapshots = [json.loads(raw) for raw in client.mget(keys) if raw] if keys else []
+    return sorted(snapshots, key=lambda s: s["opened_per_min"], reverse=True)
+
+
+@receiver(connection_created)
+def on_connection_created(sender=None, connection=None, **kwargs):
+    stats.record_open(connection)
+
+
+@worker_init.connect
+def on_worker_init(**kwargs):
+    stats.role = "worker"
+
+
+@worker_process_init.connect
+def on_worker_process_init(**kwargs):
+    # Counters inherited from the parent describe the parent's connections
+    global stats
+    stats = ConnectionStats(role="worker")
+
+
+@receiver(request_finished)
+def on_request_finished(**kwargs):
+    stats.report()
+
+
+@task_postrun.connect
+def on_task_postrun(**kwargs):
+    stats.report()
@@ -0,0 +1,179 @@
+"""
+Task dispatch through a transactional outbox.
+
+The Task row is inserted first under a pre-generated id, and the Celery
+message is published only after that row has committed, so a worker can
+never receive a task whose row does not exist yet.
+
+Every row carries its message in dispatch_payload until it has been
+published. TASK_DISPATCH_MODE selects who publishes:
+
+    on_commit  the web process publishes from transaction.on_commit (default)
+    relay      the outbox relay (manage.py run_outbox_relay) publishes pending
+               rows in batches over a single broker connection
+
+In on_commit mode, a row whose publish failed (broker down, process killed)
+is published by the republish_undispatched_tasks beat job once it is
+TASK_DISPATCH_GRACE_SECONDS old.
+
+New tasks pass admission control first (admission.py). Each message carries
+a priority when the requesting client is over its rate (see fairness.py);
+otherwise the route's priority applies.
+"""
+import logging
+import uuid
+from datetime import timedelta
+from celery import current_app
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from .admission import admit
+from .fairness import take_token
+from .idempotency import claim, claimed_task_id, dedup_key, idempotency_key_for, release
+from .models import Task
+
+logger = logging.getLogger(__name__)
+
+
+def publish(messages):
+    """
+    Publish messages ({"id", "task", "args", "kwargs", "priority"}) over one
+    broker connection
+    """
+    if not messages:
+        return
+    with current_app.producer_or_acquire() as producer:
+        for message in messages:
+            options = {}
+            if message.get("priority") is not None:
+                options["priority"] = message["priority"]
+            current_app.tasks[message["task"]].apply_async(
+                args=message["args"],
+                kwargs=message["kwargs"],
+                task_id=message["id"],
+                producer=producer,
+                **options
+            )
+
+
+def _mark_dispatched(task_ids):
+    Task.objects.filter(id__in=task_ids).update(dispatched_at=timezone.now(), dispatch_payload=None)
+
+
+def _publish_on_commit(message):
+    # The row has committed, so a failure here only delays the task: it keeps
+    # its dispatch_payload and the beat job publishes it later
+    try:
+        publish([message])
+        _mark_dispatched([message["id"]])
+    except Exception as e:
+        logger.warning(f"Could not publish task {message['id']}, leaving it to the outbox: {e}")
+
+
+def _replayed(task_id, celery_task, **fields):
+    task = Task(id=task_id, task_name=celery_task.__name__, **fields)
+    task.replayed = True
+    return task
+
+
+def replay(celery_task, idempotency_key, client_id=None, request_digest=None):
+    """
+    The task an earlier request started under idempotency_key, as enqueue
+    would return it, or None. Lets callers answer a retry before validating
+    it again. Raises IdempotencyKeyReused if the key belongs to another request.
+    """
+    if not idempotency_key:
+        return None
+    task_id = claimed_task_id(idempotency_key_for(celery_task.name, client_id, idempotency_key), request_digest)
+    return _replayed(task_id, celery_task) if task_id else None
+
+
+def enqueue(celery_task, args=(), kwargs=None, *, operation, related_table=None,
+            related_id=None, input_data=None, idempotency_key=None, request_digest=None,
+            client_id=None):
+    """
+    Record a PENDING Task row for celery_task and schedule its publication.
+    Returns the Task, with replayed=False. client_id identifies the caller
+    for fair scheduling (see fairness.py) and is recorded on the row.
+
+    If the request duplicates a read that is in flight, or a task recently
+    started under the same idempotency_key by the same client (see
+    idempotency.py), nothing is queued: the result is an unsaved Task carrying
+    that task's id, with replayed=True. request_digest identifies the request
+    behind idempotency_key; the key sent with a different request raises
+    IdempotencyKeyReused.
+
+    Raises admission.Overloaded, queueing nothing, while the task's queue is
+    saturated.
+    """
+    task_id = str(uuid.uuid4())
+    message = {
+        "id": task_id,
+        "task": celery_task.name,
+        "args": list(args),
+        "kwargs": kwargs or {},
+    }
+    relay = settings.TASK_DISPATCH_MODE == 'relay'
+
+    key, ttl = dedup_key(message["task"], message["args"], message["kwargs"], idempotency_key, client_id,
+                         operation)
+    if key:
+        existing_id = claim(key, task_id, ttl, request_digest if idempotency_key else None)
+        if existing_id:
+            return _replayed(existing_id, celery_task, operation=operation,
+                             related_table=related_table, related_id=related_id)
+
+    # Only new work counts against the client's rate
+    throttled = not take_token(client_id)
+    message["priority"] = settings.TASK_THROTTLED_PRIORITY if throttled else None
+
+    try:
+        admit(message["task"], throttled=throttled)
+        with transaction.atomic():
+            task = Task.objects.create(
+                id=task_id,
+                status="PENDING",
+                task_name=celery_task.__name__,
+                related_table=related_table,
+                related_id=related_id,
+                operation=operation,
+                client_id=client_id,
+                input_data=input_data or {},
+                result={"progress": 0},
+                dispatch_payload=message,
+            )
+            if not relay:
+                transaction.on_commit(lambda: _publish_on_commit(message))
+    except Exception:
+        # Let a retry of this request (or of a refused one) claim the key again
+        if key:
+            release(key, task_id)
+        raise
+
+    task.replayed = False
+    return task
+
+
+def relay_pending(batch_size, min_age=0):
+    """
+    Publish up to batch_size undispatched tasks, oldest first, skipping those
+    created less than min_age seconds ago. Returns how many were published.
+    Rows are locked with SKIP LOCKED so several relays can run side by side; a
+    crash between publishing and committing re-publishes the batch, so
+    delivery is at-least-once.
+    """
+    pending = Task.objects.filter(dispatched_at__isnull=True, dispatch_payload__isnull=False)
+    if min_age:
+        pending = pending.filter(created_at__lt=timezone.now() - timedelta(seconds=min_age))
+    with transaction.atomic():
+        batch = list(
+            pending.select_for_update(skip_locked=True)
+            .order_by('created_at')
+            .values_list('id', 'dispatch_payload')[:batch_size]
+        )
+        if not batch:
+            return 0
+
+        publish([payload for _, payload in batch])
+        _mark_dispatched([task_id for task_id, _ in batch])
+    return len(batch)
@@ -0,0 +1,53 @@
+"""
+Task progress events over Redis pub/sub.
+
+Every state change is published on a per-task channel and the latest
+snapshot (status and progress) is kept in a Redis key, so streaming clients
+can get the current state and follow updates without touching the database.
+The final event also carries the task's result; it is not kept in the key,
+since the Task row already holds it.
+"""
+import json
+import logging
+from django.conf import settings
+from redis.exceptions import RedisError
+from .redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+STATE_KEY = "task:state:{}"
+CHANNEL = "task:events:{}"
+TERMINAL_STATUSES = ('DONE', 'FAILED')
+
+
+def task_snapshot(task):
+    return {
+        "id": str(task.id),
+        "status": task.status,
+        "progress": task.get_progress(),
+    }
+
+
+def task_event(task):
+    """
+    The snapshot, plus the result once the task has finished
+    """
+    event = task_snapshot(task)
+    if task.status in TERMINAL_STATUSES:
+        event["result"] = task.result
+    return event
+
+
+def publish_task_event(task):
+    """
+    Store the task's latest snapshot and notify subscribers in one round trip
+    """
+    snapshot = json.dumps(task_snapshot(task))
+    event = json.dumps(task_event(task)) if task.status in TERMINAL_STATUSES else snapshot
+    try:
+        pipe = get_redis().pipeline(transaction=False)
+        pipe.set(STATE_KEY.format(task.id), snapshot, ex=settings.TASK_EVENTS_TTL)
+        pipe.publish(CHANNEL.format(task.id), event)
+        pipe.execute()
+    except RedisError as e:
+        logger.warning(f"Failed to publish event for task {task.id}: {e}")
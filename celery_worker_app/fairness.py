@@ -0,0 +1,79 @@
+"""
+Per-client fairness at dispatch.
+
+Every client (see client_id) has a token bucket in Redis that refills at
+TASK_CLIENT_RATE tasks per second up to TASK_CLIENT_BURST. A task queued with
+a token keeps its route's priority; once a client's bucket is empty,
+dispatch.enqueue queues its tasks at TASK_THROTTLED_PRIORITY (the lowest)
+instead. A client flooding a queue then only competes with itself: workers
+take everyone else's tasks first, whatever the order they arrived in. Its
+tasks are only refused once the queue is busy (see admission.py).
+
+Taking a token is one atomic script call. If Redis is unavailable, tasks
+keep their normal priority.
+"""
+import logging
+import time
+from django.conf import settings
+from redis.exceptions import RedisError
+from .redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+BUCKET_KEY = "task:bucket:{}"
+
+# KEYS[1] bucket; ARGV rate (tokens/s), burst, now (s). Returns 1 if a token was taken.
+TAKE_TOKEN = """
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local rate, burst, now = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3])
+local tokens = tonumber(bucket[1]) or burst
+local elapsed = math.max(now - (tonumber(bucket[2]) or now), 0)
+tokens = math.min(burst, tokens + elapsed * rate)
+local taken = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+    taken = 1
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 1)
+return taken
+"""
+
+_take_token = None
+
+
+def client_id(request):
+    """
+    Who is asking: the TASK_CLIENT_ID_HEADER header if one is configured,
+    else the authenticated user, else the remote address. The header is
+    off by default: a client free to set it could claim a fresh bucket on
+    every request.
+    """
+    if settings.TASK_CLIENT_ID_HEADER:
+        header = request.headers.get(settings.TASK_CLIENT_ID_HEADER)
+        if header:
+            return header[:255]
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_authenticated:
+        return f"user:{user.get_username()}"
+    return f"ip:{request.META.get('REMOTE_ADDR', '')}"
+
+
+def take_token(client):
+    """
+    Take one token from client's bucket; False once the bucket is empty
+    """
+    global _take_token
+    if not client or not settings.TASK_CLIENT_RATE:
+        return True
+    try:
+        if _take_token is None:
+            _take_token = get_redis().register_script(TAKE_TOKEN)
+        return bool(_take_token(
+            keys=[BUCKET_KEY.format(client)],
+            args=[settings.TASK_CLIENT_RATE, settings.TASK_CLIENT_BURST, time.time()],
+        ))
+    except RedisError as e:
+        logger.warning(f"Client rate limiting unavailable: {e}")
+        return True
+
@@ -0,0 +1,159 @@
+"""
+Task deduplication, so a retried or repeated request reuses the task that is
+already doing its work instead of queueing the same work again.
+
+A request is matched to a task through a Redis key holding the task's id:
+
+    Idempotency-Key header  the client's key (per client and task type); the
+                            mapping is kept for TASK_IDEMPOTENCY_KEY_TTL, so a
+                            retry after the task has finished gets the same
+                            task back
+    otherwise, for reads    a hash of the task name and its arguments; the
+                            mapping only lasts while the task is in flight
+                            (capped at TASK_DEDUP_TTL), so a later identical
+                            request runs afresh and never sees stale results
+
+Writes without a key are never deduplicated: PATCH A, PATCH B, PATCH A must
+leave A in place, not hand the third request the first one's task.
+
+An Idempotency-Key mapping also stores a digest of the request it was
+claimed for (request_fingerprint); the same key sent with a different target
+or body is refused with 422 instead of being answered with the other task.
+
+Claiming a key is a single SET NX GET round trip and never touches the
+database. If Redis is unavailable, requests are simply not deduplicated.
+"""
+import hashlib
+import json
+import logging
+from celery.signals import task_failure, task_success
+from django.conf import settings
+from redis.exceptions import RedisError
+from rest_framework import status
+from rest_framework.exceptions import APIException
+from .redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+DEDUP_KEY = "task:dedup:{}"
+
+
+class IdempotencyKeyReused(APIException):
+    status_code = status.HTTP_422_UNPROCESSABLE_ENTITY
+    default_detail = "This Idempotency-Key was already used for a different request."
+    default_code = 'idempotency_key_reused'
+
+
+def _digest(*parts):
+    return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def request_fingerprint(request):
+    """
+    Digest of what a request asks for: its path, query string and body
+    """
+    data = request.data
+    if hasattr(data, 'lists'):
+        data = dict(data.lists())
+    return _digest(request.path, sorted(request.query_params.lists()), data)
+
+
+def fingerprint(task_name, args, kwargs):
+    """
+    Digest identifying a task by its name and arguments
+    """
+    return _digest(task_name, list(args), kwargs or {})
+
+
+def fingerprint_key(task_name, args, kwargs):
+    """
+    The key shared by every request for the same task with the same arguments
+    """
+    return DEDUP_KEY.format(f"hash:{fingerprint(task_name, args, kwargs)}")
+
+
+def idempotency_key_for(task_name, client_id, idempotency_key):
+    """
+    The key for a client's Idempotency-Key; clients cannot see each other's
+    """
+    return DEDUP_KEY.format(f"key:{_digest(task_name, client_id, idempotency_key)}")
+
+
+def dedup_key(task_name, args, kwargs, idempotency_key=None, client_id=None, operation=None):
+    """
+    Return (key, ttl) for a new task, or (None, None) when it should not be
+    deduplicated
+    """
+    if idempotency_key:
+        return idempotency_key_for(task_name, client_id, idempotency_key), settings.TASK_IDEMPOTENCY_KEY_TTL
+    if settings.TASK_DEDUP_TTL and operation == 'READ':
+        return fingerprint_key(task_name, args, kwargs), settings.TASK_DEDUP_TTL
+    return None, None
+
+
+def _holder(value, request_digest=None):
+    """
+    The task id stored in a key's value. Raises IdempotencyKeyReused if the
+    key was claimed for a request other than request_digest.
+    """
+    if value is None:
+        return None
+    task_id, _, claimed_for = value.decode().partition(" ")
+    if request_digest and claimed_for and claimed_for != request_digest:
+        raise IdempotencyKeyReused()
+    return task_id
+
+
+def claim(key, task_id, ttl, request_digest=None):
+    """
+    Point key at task_id unless another task holds it. Returns the id of that
+    other task, or None if task_id now holds the key (or Redis is unavailable).
+    With request_digest, the key only matches the same request again.
+    """
+    value = f"{task_id} {request_digest}" if request_digest else task_id
+    try:
+        existing = get_redis().set(key, value, nx=True, ex=ttl, get=True)
+    except RedisError as e:
+        logger.warning(f"Task deduplication unavailable: {e}")
+        return None
+    return _holder(existing, request_digest)
+
+
+def claimed_task_id(key, request_digest=None):
+    """
+    The id of the task holding key, without claiming it; None if there is none
+    """
+    try:
+        value = get_redis().get(key)
+    except RedisError as e:
+        logger.warning(f"Task deduplication unavailable: {e}")
+        return None
+    return _holder(value, request_digest)
+
+
+def release(key, task_id):
+    """
+    Drop key if task_id still holds it
+    """
+    try:
+        client = get_redis()
+        value = client.get(key)
+        if value is not None and value.decode().partition(" ")[0] == task_id:
+            client.delete(key)
+    except RedisError as e:
+        logger.warning(f"Could not release task deduplication key: {e}")
+
+
+def _release_fingerprint(task_name, task_id, args, kwargs):
+    if settings.TASK_DEDUP_TTL:
+        release(fingerprint_key(task_name, args or (), kwargs), task_id)
+
+
+@task_success.connect
+def on_task_success(sender=None, **kwargs):
+    _release_fingerprint(sender.name, sender.request.id, sender.request.args, sender.request.kwargs)
+
+
+@task_failure.connect
+def on_task_failure(sender=None, task_id=None, args=None, kwargs=None, **extra):
+    _release_fingerprint(sender.name, task_id, args, kwargs)
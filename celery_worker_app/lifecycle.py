@@ -0,0 +1,83 @@
+"""
+Base class for Celery tasks tracked by a Task row.
+
+dispatch.enqueue records the row and signals.py moves it through its
+statuses; TrackedTask covers everything in between, so a task body only
+does its work and returns a result dict:
+
+    @shared_task(bind=True, base=TrackedTask)
+    def create_widget(self, data):
+        self.progress(50)
+        widget = Widget.objects.create(**data)
+        return {"success": True, "widget_id": str(widget.id)}
+
+The Task row is fetched at most once per run, and only if the task reports
+progress; progress writes go through ProgressReporter, which only ever
+updates the result column. Each run's outcome and duration are logged here.
+
+Read-only tasks can set single_flight=True in the decorator so identical runs
+in progress at the same time share one execution (see singleflight.py).
+"""
+import functools
+import time
+from celery import Task as CeleryTask
+from celery.utils.log import get_task_logger
+from .idempotency import fingerprint
+from .models import Task
+from .progress import ProgressReporter
+from .singleflight import run_once
+
+logger = get_task_logger(__name__)
+
+
+class TrackedTask(CeleryTask):
+    single_flight = False
+
+    def __call__(self, *args, **kwargs):
+        if self.request.called_directly:
+            return super().__call__(*args, **kwargs)
+        # The worker has already pushed this run's request; CeleryTask.__call__
+        # would push a blank one over it, so call run() itself
+        if not self.single_flight:
+            return self.run(*args, **kwargs)
+        run = functools.partial(self.run, *args, **kwargs)
+        return run_once(fingerprint(self.name, args, kwargs), run)
+
+    def before_start(self, task_id, args, kwargs):
+        self.request.started_at = time.monotonic()
+
+    @property
+    def record(self):
+        """
+        The Task row for the current run
+        """
+        record = getattr(self.request, 'task_record', None)
+        if record is None:
+            record = self.request.task_record = Task.objects.get(id=self.request.id)
+        return record
+
+    @property
+    def reporter(self):
+        reporter = getattr(self.request, 'progress_reporter', None)
+        if reporter is None:
+            reporter = self.request.progress_reporter = ProgressReporter(self.record, self)
+        return reporter
+
+    def progress(self, progress, **details):
+        """
+        Report progress (plus any extra result keys) for the current run
+        """
+        self.reporter.update(progress, **details)
+
+    def flush_progress(self):
+        """
+        Write any coalesced progress now, e.g. before the run hands off to a retry
+        """
+        if getattr(self.request, 'progress_reporter', None) is not None:
+            self.request.progress_reporter.flush()
+
+    def after_return(self, status, retval, task_id, args, kwargs, einfo):
+        started_at = getattr(self.request, 'started_at', None)
+        if started_at is not None:
+            elapsed_ms = (time.monotonic() - started_at) * 1000
+            logger.info(f"Task {task_id} {status} after {elapsed_ms:.0f} ms")
@@ -0,0 +1,80 @@
+from datetime import timedelta
+import os
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Q
+from django.utils import timezone
+from celery_worker_app.models import Task
+from celery_worker_app.retention import FINISHED_STATUSES, write_archive
+
+
+def compact_result(result):
+    """
+    Keep only the scalar keys of a result (status message, ids, counters),
+    dropping bulky payloads such as user pages or per-row bulk outcomes
+    """
+    compacted = {key: value for key, value in (result or {}).items()
+                 if not isinstance(value, (list, dict))}
+    compacted["compacted"] = True
+    return compacted
+
+
+class Command(BaseCommand):
+    help = ("Export finished tasks to gzip-compressed JSON lines and/or shrink them: "
+            "--delete removes them, --compact strips input_data and bulky result payloads")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than-days', type=int, default=7)
+        parser.add_argument('--status', nargs='+', choices=FINISHED_STATUSES, default=list(FINISHED_STATUSES))
+        parser.add_argument('--export-dir', help="Write the selected tasks to a .jsonl.gz file here first")
+        action = parser.add_mutually_exclusive_group()
+        action.add_argument('--delete', action='store_true')
+        action.add_argument('--compact', action='store_true')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        if not (options['export_dir'] or options['delete'] or options['compact']):
+            raise CommandError("Nothing to do: pass --export-dir, --delete and/or --compact")
+
+        cutoff = timezone.now() - timedelta(days=options['older_than_days'])
+        queryset = Task.objects.filter(created_at__lt=cutoff, status__in=options['status'])
+        batches = self._batches(queryset, options['batch_size'])
+
+        if options['export_dir']:
+            path = os.path.join(options['export_dir'], f"tasks-{timezone.now():%Y%m%dT%H%M%S}.jsonl.gz")
+            exported = write_archive(path, self._apply(batches, options))
+            self.stdout.write(f"Exported {exported} tasks to {path}")
+        else:
+            processed = sum(1 for _ in self._apply(batches, options))
+            self.stdout.write(f"Processed {processed} tasks")
+
+    def _batches(self, queryset, batch_size):
+        """
+        Walk the selection in (created_at, id) order with a keyset, so deleting
+        or rewriting rows never shifts later batches
+        """
+        last = None
+        while True:
+            page = queryset.order_by('created_at', 'id')
+            if last:
+                page = page.filter(Q(created_at__gt=last[0]) | Q(created_at=last[0], id__gt=last[1]))
+            rows = list(page.values()[:batch_size])
+            if not rows:
+                return
+            yield rows
+            last = (rows[-1]['created_at'], rows[-1]['id'])
+
+    def _apply(self, batches, options):
+        for rows in batches:
+            # Rows are yielded (and exported) before the batch is changed
+            yield from rows
+            ids = [row['id'] for row in rows]
+            if options['delete']:
+                Task.objects.filter(id__in=ids).delete()
+            elif options['compact']:
+                # A new updated_at gives the compacted tasks new ETags
+                now = timezone.now()
+                Task.objects.bulk_update(
+                    [Task(id=row['id'], input_data={}, result=compact_result(row['result']), updated_at=now)
+                     for row in rows],
+                    ['input_data', 'result', 'updated_at']
+                )
@@ -0,0 +1,25 @@
+import json
+from django.core.management.base import BaseCommand
+from celery_worker_app.db_connections import read_all
+
+
+class Command(BaseCommand):
+    help = "Show database connections opened and closed by each web and worker process"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--json', action='store_true', help="Print the raw snapshots as JSON")
+
+    def handle(self, *args, **options):
+        snapshots = read_all()
+        if options['json']:
+            self.stdout.write(json.dumps(snapshots, indent=2))
+            return
+        if not snapshots:
+            self.stdout.write("No processes have reported connection stats")
+            return
+
+        self.stdout.write(f"{'process':<32} {'role':<7} {'open':>5} {'opened':>7} {'closed':>7} "
+                          f"{'opened/min':>11} {'closed/min':>11}")
+        for s in snapshots:
+            self.stdout.write(f"{s['process']:<32} {s['role']:<7} {s['open']:>5} {s['opened']:>7} "
+                              f"{s['closed']:>7} {s['opened_per_min']:>11} {s['closed_per_min']:>11}")
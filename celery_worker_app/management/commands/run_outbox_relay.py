@@ -0,0 +1,29 @@
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from celery_worker_app.dispatch import relay_pending
+
+
+class Command(BaseCommand):
+    help = "Publish tasks queued with TASK_DISPATCH_MODE='relay' to the broker in batches"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=settings.TASK_OUTBOX_BATCH_SIZE)
+        parser.add_argument('--poll-interval', type=float, default=settings.TASK_OUTBOX_POLL_INTERVAL,
+                            help="Seconds to wait when the outbox is empty")
+        parser.add_argument('--once', action='store_true', help="Drain the outbox once and exit")
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        self.stdout.write(f"Outbox relay started (batch size {batch_size})")
+
+        while True:
+            published = relay_pending(batch_size)
+            if published:
+                self.stdout.write(f"Published {published} tasks")
+            # Keep draining while batches come back full
+            if published == batch_size:
+                continue
+            if options['once']:
+                return
+            time.sleep(options['poll_interval'])
@@ -0,0 +1,240 @@
+"""
+Prometheus metrics for the web app and the workers.
+
+    celery_task_queue_wait_seconds   publish (or ETA) to start, per task name
+    celery_task_run_seconds          run time, per task name
+    celery_tasks_total               finished runs per task name and state
+                                     (SUCCESS, FAILURE, RETRY)
+    celery_queue_length              messages waiting in each broker queue
+    tasks_rejected_total             new tasks refused by admission control,
+                                     per task name and status code
+    tasks_by_status                  Task rows per status (finished ones
+                                     estimated from planner statistics)
+    http_request_duration_seconds    request time, per view and method
+    http_request_db_queries          database queries per request, per view
+    http_request_db_seconds          database time per request, per view
+
+The web app serves everything at /metrics; queue lengths and Task counts are
+read from Redis and PostgreSQL when scraped (through the cached
+backlog.snapshot()), so they only come from there.
+Workers serve their task metrics on WORKER_METRICS_PORT.
+
+Gunicorn and prefork workers run several processes, so set
+PROMETHEUS_MULTIPROC_DIR to a per-container directory: every process then
+writes its samples there and whichever one is scraped reports them all.
+"""
+import logging
+import os
+import shutil
+import time
+from contextvars import ContextVar
+from datetime import datetime
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from celery.signals import before_task_publish, task_postrun, task_prerun, worker_init
+from django.conf import settings
+from django.db import DatabaseError
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from prometheus_client import (
+    REGISTRY, CollectorRegistry, Counter, Histogram, generate_latest, multiprocess, start_http_server,
+)
+from prometheus_client.core import GaugeMetricFamily
+from .backlog import estimated_counts, snapshot
+from .models import Task
+
+logger = logging.getLogger(__name__)
+
+SECONDS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+QUERY_COUNTS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 100)
+
+TASK_QUEUE_WAIT = Histogram(
+    'celery_task_queue_wait_seconds', "Time from publish (or ETA) until a worker starts the task",
+    ['task_name'], buckets=SECONDS,
+)
+TASK_RUN_TIME = Histogram(
+    'celery_task_run_seconds', "Task run time", ['task_name'], buckets=SECONDS,
+)
+TASKS_FINISHED = Counter(
+    'celery_tasks', "Finished task runs", ['task_name', 'state'],
+)
+TASKS_REJECTED = Counter(
+    'tasks_rejected', "New tasks refused by admission control", ['task_name', 'status'],
+)
+REQUEST_DURATION = Histogram(
+    'http_request_duration_seconds', "Request time", ['view', 'method'], buckets=SECONDS,
+)
+REQUEST_DB_QUERIES = Histogram(
+    'http_request_db_queries', "Database queries per request", ['view'], buckets=QUERY_COUNTS,
+)
+REQUEST_DB_TIME = Histogram(
+    'http_request_db_seconds', "Database time per request", ['view'], buckets=SECONDS,
+)
+
+
+def process_registry():
+    """
+    The registry holding this process's metrics, or every process's when
+    PROMETHEUS_MULTIPROC_DIR is set
+    """
+    if not os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        return REGISTRY
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return registry
+
+
+def reset_multiprocess_dir():
+    """
+    Start with an empty PROMETHEUS_MULTIPROC_DIR; call once before any
+    process writes to it
+    """
+    path = os.environ.get('PROMETHEUS_MULTIPROC_DIR')
+    if path:
+        shutil.rmtree(path, ignore_errors=True)
+        os.makedirs(path, exist_ok=True)
+
+
+class BacklogCollector:
+    """
+    Broker queue lengths and Task status counts, read at scrape time
+    """
+    def collect(self):
+        backlog = snapshot()
+        queue_length = GaugeMetricFamily('celery_queue_length', "Messages waiting in the broker queue",
+                                         labels=['queue'])
+        for queue, length in backlog["queues"].items():
+            queue_length.add_metric([queue], length)
+        yield queue_length
+
+        by_status = GaugeMetricFamily('tasks_by_status', "Task rows per status", labels=['status'])
+        try:
+            counts = {**estimated_counts(), **backlog["active"]}
+        except DatabaseError as e:
+            logger.warning(f"Could not estimate task counts: {e}")
+            counts = backlog["active"]
+        for status, _ in Task.STATUS_CHOICES:
+            by_status.add_metric([status], counts.get(status, 0))
+        yield by_status
+
+
+_backlog = CollectorRegistry(auto_describe=False)
+_backlog.register(BacklogCollector())
+
+
+def export():
+    """
+    The /metrics payload: request and task metrics plus the backlog
+    """
+    return generate_latest(process_registry()) + generate_latest(_backlog)
+
+
+# -- Web requests --
+
+_request_queries = ContextVar('request_queries', default=None)
+
+
+class QueryStats:
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+
+def record_query(execute, sql, params, many, context):
+    stats = _request_queries.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.count += 1
+        stats.seconds += time.perf_counter() - started
+
+
+@receiver(connection_created)
+def on_connection_created(sender=None, connection=None, **kwargs):
+    # Every connection counts queries for the request being served, including
+    # connections used from sync_to_async threads (they see the same context)
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+class MetricsMiddleware:
+    """
+    Time each request and count its database queries, labelled by view name
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        stats, token, started = self.start()
+        try:
+            return self.get_response(request)
+        finally:
+            self.finish(request, stats, token, started)
+
+    async def __acall__(self, request):
+        stats, token, started = self.start()
+        try:
+            return await self.get_response(request)
+        finally:
+            self.finish(request, stats, token, started)
+
+    def start(self):
+        stats = QueryStats()
+        return stats, _request_queries.set(stats), time.perf_counter()
+
+    def finish(self, request, stats, token, started):
+        elapsed = time.perf_counter() - started
+        _request_queries.reset(token)
+        match = request.resolver_match
+        view = match.view_name if match is not None else "unmatched"
+        REQUEST_DURATION.labels(view, request.method).observe(elapsed)
+        REQUEST_DB_QUERIES.labels(view).observe(stats.count)
+        REQUEST_DB_TIME.labels(view).observe(stats.seconds)
+
+
+# -- Celery tasks --
+
+@before_task_publish.connect
+def on_before_task_publish(headers=None, **kwargs):
+    # Reaches the worker as request.enqueued_at; set again on every retry
+    if headers is not None:
+        headers['enqueued_at'] = time.time()
+
+
+@task_prerun.connect
+def on_task_prerun(sender=None, task=None, **kwargs):
+    request = task.request
+    request.metrics_started_at = time.monotonic()
+    enqueued_at = getattr(request, 'enqueued_at', None)
+    if enqueued_at is None:
+        return
+    ready_at = enqueued_at
+    if request.eta:
+        ready_at = max(ready_at, datetime.fromisoformat(request.eta).timestamp())
+    TASK_QUEUE_WAIT.labels(task.name).observe(max(time.time() - ready_at, 0))
+
+
+@task_postrun.connect
+def on_task_postrun(sender=None, task=None, state=None, **kwargs):
+    started_at = getattr(task.request, 'metrics_started_at', None)
+    if started_at is not None:
+        TASK_RUN_TIME.labels(task.name).observe(time.monotonic() - started_at)
+    TASKS_FINISHED.labels(task.name, state or "UNKNOWN").inc()
+
+
+@worker_init.connect
+def on_worker_init(**kwargs):
+    reset_multiprocess_dir()
+    if settings.WORKER_METRICS_PORT:
+        start_http_server(settings.WORKER_METRICS_PORT, registry=process_registry())
+        logger.info(f"Serving worker metrics on port {settings.WORKER_METRICS_PORT}")
@@ -0,0 +1,34 @@
+# Generated by Django 4.2.10 on 2026-10-18 12:47
+
+from django.db import migrations, models
+
+
+def mark_existing_dispatched(apps, schema_editor):
+    # Tasks created before the outbox were published directly by the API
+    Task = apps.get_model('celery_worker_app', 'Task')
+    Task.objects.update(dispatched_at=models.F('created_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('celery_worker_app', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='task',
+            name='dispatch_payload',
+            field=models.JSONField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='task',
+            name='dispatched_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.RunPython(mark_existing_dispatched, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(condition=models.Q(('dispatched_at__isnull', True)), fields=['created_at'], name='task_outbox_pending_idx'),
+        ),
+    ]
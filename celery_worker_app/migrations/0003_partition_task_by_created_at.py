@@ -0,0 +1,92 @@
+# Converts the Task table into a table range-partitioned by created_at.
+# PostgreSQL only; other databases keep the plain table. See partitions.py.
+
+from datetime import datetime, time, timedelta, timezone
+
+from django.db import migrations
+
+TABLE = 'celery_worker_app_task'
+DAYS_AHEAD = 7
+
+
+def _secondary_indexes(cursor, table):
+    cursor.execute(
+        "SELECT indexname, indexdef FROM pg_indexes WHERE tablename = %s AND indexname <> %s",
+        [table, f"{table}_pkey"]
+    )
+    return cursor.fetchall()
+
+
+def _swap_table(cursor, create_sql, primary_key):
+    """
+    Rebuild TABLE with create_sql, keeping its rows and secondary indexes
+    """
+    indexes = _secondary_indexes(cursor, TABLE)
+    for name, _ in indexes:
+        cursor.execute(f"DROP INDEX {name}")
+
+    cursor.execute(f"ALTER TABLE {TABLE} RENAME TO {TABLE}_old")
+    cursor.execute(f"ALTER TABLE {TABLE}_old RENAME CONSTRAINT {TABLE}_pkey TO {TABLE}_old_pkey")
+    cursor.execute(create_sql)
+    cursor.execute(f"ALTER TABLE {TABLE} ADD CONSTRAINT {TABLE}_pkey PRIMARY KEY ({primary_key})")
+    return indexes
+
+
+def _finish_swap(cursor, indexes):
+    cursor.execute(f"INSERT INTO {TABLE} SELECT * FROM {TABLE}_old")
+    cursor.execute(f"DROP TABLE {TABLE}_old CASCADE")
+    for _, definition in indexes:
+        cursor.execute(definition.replace(" ON ONLY ", " ON "))
+
+
+def partition_task_table(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+
+    with schema_editor.connection.cursor() as cursor:
+        indexes = _swap_table(
+            cursor,
+            f"CREATE TABLE {TABLE} (LIKE {TABLE}_old INCLUDING DEFAULTS) PARTITION BY RANGE (created_at)",
+            # Unique constraints on a partitioned table must include the partition key
+            "id, created_at"
+        )
+
+        today = datetime.combine(datetime.now(timezone.utc).date(), time.min, tzinfo=timezone.utc)
+        # Everything created before today lands in one partition that retention drops as a whole
+        cursor.execute(
+            f"CREATE TABLE {TABLE}_legacy PARTITION OF {TABLE} FOR VALUES FROM (MINVALUE) TO (%s)",
+            [today.isoformat()]
+        )
+        for offset in range(DAYS_AHEAD + 1):
+            lower = today + timedelta(days=offset)
+            cursor.execute(
+                f"CREATE TABLE {TABLE}_p{lower:%Y%m%d} PARTITION OF {TABLE} FOR VALUES FROM (%s) TO (%s)",
+                [lower.isoformat(), (lower + timedelta(days=1)).isoformat()]
+            )
+        cursor.execute(f"CREATE TABLE {TABLE}_default PARTITION OF {TABLE} DEFAULT")
+
+        _finish_swap(cursor, indexes)
+
+
+def unpartition_task_table(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+
+    with schema_editor.connection.cursor() as cursor:
+        indexes = _swap_table(
+            cursor,
+            f"CREATE TABLE {TABLE} (LIKE {TABLE}_old INCLUDING DEFAULTS)",
+            "id"
+        )
+        _finish_swap(cursor, indexes)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('celery_worker_app', '0002_task_outbox'),
+    ]
+
+    operations = [
+        migrations.RunPython(partition_task_table, unpartition_task_table),
+    ]
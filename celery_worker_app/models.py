@@ -1,5 +1,12 @@
-from django.db import models
+from django.db import connections, models, router
+from django.db.models.expressions import RawSQL
+from django.utils import timezone
+import json
 import uuid
+from .events import publish_task_event
+
+# Tasks that have not finished yet
+ACTIVE_STATUSES = ['PENDING', 'PROCESSING']
 
 class Task(models.Model):
     STATUS_CHOICES = [
@@ -10,8 +17,9 @@ class Task(models.Model):
     ]
     
     id = models.CharField(primary_key=True, max_length=255, default=uuid.uuid4)
-    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='PENDING', db_index=True)
-    task_name = models.CharField(max_length=255, db_index=True)
+    # Indexed through the composite indexes in Meta
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='PENDING')
+    task_name = models.CharField(max_length=255)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     input_data = models.JSONField(default=dict)
@@ -20,6 +28,31 @@ class Task(models.Model):
     related_table = models.CharField(max_length=100, blank=True, null=True)
     related_id = models.CharField(max_length=255, blank=True, null=True)
     operation = models.CharField(max_length=20, blank=True, null=True)  # CREATE, UPDATE, DELETE, READ
+    # Outbox: the Celery message waiting for the relay, and when it was handed to the broker
+    dispatch_payload = models.JSONField(null=True, blank=True)
+    dispatched_at = models.DateTimeField(null=True, blank=True)
+    # Who asked for the task (see fairness.py), and how long it waited in the
+    # broker queue before a worker first started it
+    client_id = models.CharField(max_length=255, blank=True, null=True)
+    queue_wait_ms = models.IntegerField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # Lets the outbox relay find undispatched tasks without scanning the table
+            models.Index(fields=['created_at'], condition=models.Q(dispatched_at__isnull=True),
+                         name='task_outbox_pending_idx'),
+            # Task list: cursor pagination on (created_at, id), optionally filtered
+            models.Index(fields=['-created_at', '-id'], name='task_created_idx'),
+            models.Index(fields=['status', '-created_at'], name='task_status_created_idx'),
+            models.Index(fields=['task_name', '-created_at'], name='task_name_created_idx'),
+            models.Index(fields=['related_table', 'related_id', '-created_at'],
+                         name='task_related_created_idx'),
+            models.Index(fields=['client_id', '-created_at'], name='task_client_created_idx'),
+            # "Active tasks for record X" only ever touches the few unfinished rows
+            models.Index(fields=['related_table', 'related_id', '-created_at'],
+                         condition=models.Q(status__in=ACTIVE_STATUSES),
+                         name='task_active_related_idx'),
+        ]
 
     def __str__(self):
         return f"{self.task_name} ({self.id})"
@@ -30,9 +63,30 @@ class Task(models.Model):
         return 0
     
     def set_progress(self, progress):
+        self.merge_result(progress=progress)
+        self.publish_event()
+    
+    def merge_result(self, **values):
+        """
+        Write the given top-level keys of result without rewriting the others.
+        On PostgreSQL this is one atomic in-place jsonb update.
+        """
         if not self.result:
             self.result = {}
-        current_result = self.result
-        current_result['progress'] = progress
-        self.result = current_result
-        self.save(update_fields=['result'])
\ No newline at end of file
+        self.result.update(values)
+        
+        if connections[router.db_for_write(Task)].vendor != 'postgresql':
+            self.save(update_fields=['result', 'updated_at'])
+            return
+        
+        self.updated_at = timezone.now()
+        Task.objects.filter(pk=self.pk).update(
+            result=RawSQL("COALESCE(result, '{}'::jsonb) || %s::jsonb", (json.dumps(values),)),
+            updated_at=self.updated_at
+        )
+    
+    def publish_event(self):
+        """
+        Push the current status and progress to clients streaming this task
+        """
+        publish_task_event(self)
\ No newline at end of file
@@ -0,0 +1,14 @@
+from django.conf import settings
+from rest_framework.pagination import CursorPagination
+
+
+class TaskCursorPagination(CursorPagination):
+    """
+    Newest tasks first. The cursor seeks on created_at (id breaks ties), which
+    the (created_at, id) indexes on Task serve directly, so every page is an
+    index range scan however deep the client pages.
+    """
+    ordering = ('-created_at', '-id')
+    page_size = settings.TASK_LIST_PAGE_SIZE
+    page_size_query_param = 'page_size'
+    max_page_size = settings.TASK_LIST_MAX_PAGE_SIZE
@@ -0,0 +1,136 @@
+"""
+Daily range partitions of the Task table on PostgreSQL.
+
+Migration 0003 turns celery_worker_app_task into a table partitioned by
+created_at, with a primary key of (id, created_at) since PostgreSQL requires
+the partition key in every unique constraint; Django still treats id alone
+as the primary key, which holds because ids are generated uuids. Rows live
+in one partition per UTC day, created ahead of time by ensure_partitions(),
+plus a DEFAULT partition that only catches rows outside the prepared range.
+Old days are removed by detaching and dropping whole partitions, which
+keeps the table and its indexes bounded without DELETE churn or VACUUM.
+"""
+from datetime import datetime, time, timedelta, timezone as dt_timezone
+import re
+from django.db import connection, transaction
+from django.utils.dateparse import parse_datetime
+
+PARENT_TABLE = 'celery_worker_app_task'
+DEFAULT_PARTITION = f"{PARENT_TABLE}_default"
+BOUND_RE = re.compile(r"FROM \((.+?)\) TO \((.+?)\)")
+
+
+def is_partitioned():
+    if connection.vendor != 'postgresql':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT relkind FROM pg_class WHERE relname = %s", [PARENT_TABLE])
+        row = cursor.fetchone()
+    return bool(row) and row[0] == 'p'
+
+
+def _parse_bound(value):
+    value = value.strip("'")
+    if value in ('MINVALUE', 'MAXVALUE'):
+        return None
+    return parse_datetime(value)
+
+
+def list_partitions():
+    """
+    Return (name, lower, upper) for every range partition; None marks an open bound.
+    The DEFAULT partition is not included.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT child.relname, pg_get_expr(child.relpartbound, child.oid)
+            FROM pg_inherits
+            JOIN pg_class parent ON parent.oid = pg_inherits.inhparent
+            JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+            WHERE parent.relname = %s
+            """,
+            [PARENT_TABLE]
+        )
+        rows = cursor.fetchall()
+
+    partitions = []
+    for name, bound in rows:
+        match = BOUND_RE.search(bound)
+        if match:
+            partitions.append((name, _parse_bound(match.group(1)), _parse_bound(match.group(2))))
+    return sorted(partitions, key=lambda p: p[2] or datetime.max.replace(tzinfo=dt_timezone.utc))
+
+
+def partition_name(day):
+    return f"{PARENT_TABLE}_p{day:%Y%m%d}"
+
+
+def ensure_partitions(days_ahead, today=None):
+    """
+    Create the daily partitions from today up to days_ahead days out.
+    Returns the names of the partitions created.
+    """
+    today = today or datetime.now(dt_timezone.utc).date()
+    existing = list_partitions()
+    created = []
+
+    with connection.cursor() as cursor:
+        for offset in range(days_ahead + 1):
+            day = today + timedelta(days=offset)
+            lower = datetime.combine(day, time.min, tzinfo=dt_timezone.utc)
+            upper = lower + timedelta(days=1)
+
+            # Skip days already covered, e.g. by the partition holding pre-partitioning rows
+            if any((lo is None or lo < upper) and (hi is None or hi > lower) for _, lo, hi in existing):
+                continue
+
+            name = partition_name(day)
+            _create_partition(cursor, name, lower, upper)
+            created.append(name)
+    return created
+
+
+def _create_partition(cursor, name, lower, upper):
+    bounds = [lower.isoformat(), upper.isoformat()]
+    cursor.execute(
+        f"SELECT EXISTS (SELECT 1 FROM {DEFAULT_PARTITION} WHERE created_at >= %s AND created_at < %s)",
+        bounds
+    )
+    if not cursor.fetchone()[0]:
+        cursor.execute(
+            f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF {PARENT_TABLE} FOR VALUES FROM (%s) TO (%s)",
+            bounds
+        )
+        return
+
+    # Rows that arrived before their day's partition existed sit in DEFAULT,
+    # which blocks creating the partition; move them across while it is detached
+    with transaction.atomic():
+        cursor.execute(f"ALTER TABLE {PARENT_TABLE} DETACH PARTITION {DEFAULT_PARTITION}")
+        cursor.execute(
+            f"CREATE TABLE {name} PARTITION OF {PARENT_TABLE} FOR VALUES FROM (%s) TO (%s)",
+            bounds
+        )
+        cursor.execute(
+            f"INSERT INTO {name} SELECT * FROM {DEFAULT_PARTITION} WHERE created_at >= %s AND created_at < %s",
+            bounds
+        )
+        cursor.execute(
+            f"DELETE FROM {DEFAULT_PARTITION} WHERE created_at >= %s AND created_at < %s",
+            bounds
+        )
+        cursor.execute(f"ALTER TABLE {PARENT_TABLE} ATTACH PARTITION {DEFAULT_PARTITION} DEFAULT")
+
+
+def expired_partitions(cutoff):
+    """
+    Partitions whose rows are all older than cutoff
+    """
+    return [name for name, _, upper in list_partitions() if upper is not None and upper <= cutoff]
+
+
+def drop_partition(name):
+    with connection.cursor() as cursor:
+        cursor.execute(f"ALTER TABLE {PARENT_TABLE} DETACH PARTITION {name}")
+        cursor.execute(f"DROP TABLE {name}")
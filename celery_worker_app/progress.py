@@ -0,0 +1,65 @@
+"""
+Coalesced progress reporting for long-running tasks.
+
+Every update is published to Redis straight away (see events.py), so
+streaming clients always see live progress. Writes to PostgreSQL and to the
+Celery result backend are coalesced: they happen at most once per flush
+interval, configured per task name in TASK_PROGRESS_FLUSH_MS. Tasks that
+ignore their results (the default, see CELERY_TASK_IGNORE_RESULT) skip the
+result backend altogether. Status transitions are recorded separately by
+signals.py and always written.
+"""
+import time
+from django.conf import settings
+
+
+def progress_flush_interval(task_name):
+    """
+    Milliseconds between progress writes for task_name; None means the
+    database only sees progress on status transitions
+    """
+    intervals = settings.TASK_PROGRESS_FLUSH_MS
+    return intervals.get(task_name, intervals.get('default', 0))
+
+
+class ProgressReporter:
+    def __init__(self, task, celery_task=None):
+        self.task = task
+        self.celery_task = celery_task
+        self.flush_interval = progress_flush_interval(task.task_name)
+        self._pending = {}
+        self._last_flush = time.monotonic()
+
+    def update(self, progress, **details):
+        """
+        Record progress (plus any extra result keys). Clients are notified
+        immediately; the database write waits for the flush interval.
+        """
+        values = {"progress": progress, **details}
+        self.task.result = {**(self.task.result or {}), **values}
+        self._pending.update(values)
+        self.task.publish_event()
+
+        if self._flush_due():
+            self.flush()
+
+    def _flush_due(self):
+        if self.flush_interval is None:
+            return False
+        return (time.monotonic() - self._last_flush) * 1000 >= self.flush_interval
+
+    def flush(self):
+        """
+        Write pending progress to PostgreSQL and, if the task keeps results,
+        the Celery result backend
+        """
+        if not self._pending:
+            return
+        self.task.merge_result(**self._pending)
+        if self.celery_task is not None and not self.celery_task.ignore_result:
+            self.celery_task.update_state(
+                state="PROGRESS",
+                meta={"progress": self.task.get_progress()}
+            )
+        self._pending = {}
+        self._last_flush = time.monotonic()
@@ -0,0 +1,33 @@
+"""
+Shared Redis connection for features that talk to Redis directly rather than
+through Celery. Defaults to the broker's Redis instance (see REDIS_URL).
+
+Every caller treats Redis as optional and carries on without it, so
+connecting and each command give up after REDIS_SOCKET_TIMEOUT seconds
+instead of the operating system's TCP timeout.
+"""
+import redis
+from django.conf import settings
+
+_client = None
+
+
+def client_options():
+    """
+    Options for every Redis client the apps create
+    """
+    return {
+        "socket_connect_timeout": settings.REDIS_SOCKET_TIMEOUT,
+        "socket_timeout": settings.REDIS_SOCKET_TIMEOUT,
+    }
+
+
+def get_redis():
+    """
+    Return the process-wide Redis client. redis-py's connection pool is
+    fork-aware, so workers forked from a parent that already connected are safe.
+    """
+    global _client
+    if _client is None:
+        _client = redis.Redis.from_url(settings.REDIS_URL, **client_options())
+    return _client
@@ -0,0 +1,23 @@
+"""
+JSON renderer for the API backed by orjson, which encodes large responses
+(task and user lists) several times faster than the standard library and
+formats datetimes and UUIDs natively, in the same form DRF uses.
+"""
+import orjson
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+_encoder = JSONEncoder()
+
+
+class ORJSONRenderer(JSONRenderer):
+    options = orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        # Indented output (the browsable API, ?indent=) stays with DRF's encoder
+        if self.get_indent(accepted_media_type, renderer_context or {}):
+            return super().render(data, accepted_media_type, renderer_context)
+        # Types orjson does not know (Decimal, lazy strings...) are converted the DRF way
+        return orjson.dumps(data, default=_encoder.default, option=self.options)
@@ -0,0 +1,75 @@
+"""
+Task retention: keeps the Task table bounded.
+
+On PostgreSQL expired days are dropped a whole partition at a time (see
+partitions.py), optionally archiving each partition to a gzip-compressed
+JSON lines file first. Elsewhere, expired finished tasks are deleted.
+"""
+from datetime import timedelta
+import gzip
+import json
+import os
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection
+from django.utils import timezone
+from .models import Task
+from .partitions import drop_partition, ensure_partitions, expired_partitions, is_partitioned
+
+FINISHED_STATUSES = ('DONE', 'FAILED')
+
+
+def write_archive(path, rows):
+    """
+    Write rows (dicts) to path as gzip-compressed JSON lines; returns the row count.
+    The file only appears under its final name once fully written.
+    """
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    count = 0
+    with gzip.open(path + '.partial', 'wt', encoding='utf-8') as archive:
+        for row in rows:
+            archive.write(json.dumps(row, cls=DjangoJSONEncoder) + "\n")
+            count += 1
+    os.replace(path + '.partial', path)
+    return count
+
+
+def partition_rows(name, chunk_size=2000):
+    """
+    Stream every row of a partition through a server-side cursor
+    """
+    with connection.chunked_cursor() as cursor:
+        cursor.execute(f"SELECT row_to_json(t) FROM {name} t")
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            for (row,) in rows:
+                yield row
+
+
+def apply_retention(retention_days, days_ahead, archive_dir=None):
+    """
+    Prepare upcoming partitions and remove tasks older than retention_days.
+    Returns a summary of what was done.
+    """
+    cutoff = timezone.now() - timedelta(days=retention_days)
+
+    if not is_partitioned():
+        expired = Task.objects.filter(created_at__lt=cutoff, status__in=FINISHED_STATUSES)
+        if archive_dir:
+            path = os.path.join(archive_dir, f"tasks-before-{cutoff:%Y%m%dT%H%M%S}.jsonl.gz")
+            write_archive(path, expired.values().iterator())
+        deleted, _ = expired.delete()
+        return {"partitioned": False, "deleted": deleted}
+
+    created = ensure_partitions(days_ahead)
+    dropped = []
+    archived = 0
+    # Whole days go at once, including tasks that never finished
+    for name in expired_partitions(cutoff):
+        if archive_dir:
+            archived += write_archive(os.path.join(archive_dir, f"{name}.jsonl.gz"), partition_rows(name))
+        drop_partition(name)
+        dropped.append(name)
+
+    return {"partitioned": True, "created": created, "dropped": dropped, "archived": archived}
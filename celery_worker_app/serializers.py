@@ -1,25 +1,39 @@
+from django.db.models.fields.json import KeyTransform
 from rest_framework import serializers
 from .models import Task
 
+# Fields of the lean task representation (see task_values), in API order
+TASK_LIST_FIELDS = ['id', 'status', 'task_name', 'created_at', 'updated_at',
+                    'related_table', 'related_id', 'operation', 'client_id', 'queue_wait_ms']
+TASK_FIELDS = TASK_LIST_FIELDS + ['input_data', 'result']
+
+
+def task_values(queryset, fields=TASK_LIST_FIELDS):
+    """
+    The queryset as plain dicts of fields plus progress, which the database
+    extracts from the result JSON. The API builds its task responses from
+    these rows (via task_row) rather than model instances and serializers.
+    """
+    return queryset.values(*fields, progress=KeyTransform('progress', 'result'))
+
+
+def task_row(row):
+    """
+    Finish a task_values() row for the response; the renderer handles the
+    datetimes
+    """
+    if row['progress'] is None:
+        row['progress'] = 0
+    return row
+
+
+
 class TaskSerializer(serializers.ModelSerializer):
-    progress = serializers.SerializerMethodField()
-    
-    class Meta:
-        model = Task
-        fields = ['id', 'status', 'task_name', 'created_at', 'updated_at', 
-                  'input_data', 'result', 'progress', 'related_table', 
-                  'related_id', 'operation']
-    
-    def get_progress(self, obj):
-        return obj.get_progress()
-
-class TaskListSerializer(serializers.ModelSerializer):
-    progress = serializers.SerializerMethodField()
-    
+    """
+    Describes tasks to the browsable API; responses are built by task_values
+    """
+    progress = serializers.ReadOnlyField()
+
     class Meta:
         model = Task
-        fields = ['id', 'status', 'task_name', 'created_at', 'updated_at', 
-                 'progress', 'related_table', 'related_id', 'operation']
-    
-    def get_progress(self, obj):
-        return obj.get_progress()
\ No newline at end of file
+        fields = TASK_FIELDS + ['progress']
@@ -0,0 +1,78 @@
+"""
+Task status transitions, driven by Celery signals.
+
+The worker is the only writer of Task.status:
+
+    task_prerun   PENDING             -> PROCESSING  (queue_wait_ms = time since publish)
+    task_success  PENDING/PROCESSING  -> DONE    (result = task return value)
+    task_failure  PENDING/PROCESSING  -> FAILED  (result = error)
+
+Each transition is a single conditional UPDATE, so a late or repeated
+signal can never move a task out of a terminal state, and the API only
+ever reads Task rows. Only TrackedTask tasks have a row; other tasks (the
+beat jobs) and the reruns of a retried task, whose row is already
+PROCESSING, are skipped without a query.
+"""
+import logging
+import time
+from celery.signals import task_failure, task_prerun, task_success
+from django.utils import timezone
+from .events import publish_task_event
+from .lifecycle import TrackedTask
+from .models import Task
+
+logger = logging.getLogger(__name__)
+
+ALLOWED_FROM = {
+    "PROCESSING": ("PENDING",),
+    "DONE": ("PENDING", "PROCESSING"),
+    "FAILED": ("PENDING", "PROCESSING"),
+}
+
+
+def transition(task_id, status, result=None, **fields):
+    """
+    Move a task to status, also setting any other given fields, if the
+    transition is allowed; returns True if it moved
+    """
+    values = {"status": status, "updated_at": timezone.now(), **fields}
+    if result is not None:
+        values["result"] = result
+
+    updated = Task.objects.filter(
+        id=task_id, status__in=ALLOWED_FROM[status]
+    ).update(**values)
+
+    if updated:
+        publish_task_event(Task(id=task_id, status=status, result=result or {"progress": 0}))
+    return bool(updated)
+
+
+@task_prerun.connect
+def on_task_prerun(task_id=None, task=None, **kwargs):
+    if not isinstance(task, TrackedTask) or task.request.retries:
+        return
+    # enqueued_at is stamped on every published message (see metrics.py)
+    enqueued_at = getattr(task.request, 'enqueued_at', None)
+    if enqueued_at is None:
+        transition(task_id, "PROCESSING")
+        return
+    queue_wait_ms = max(int((time.time() - enqueued_at) * 1000), 0)
+    transition(task_id, "PROCESSING", queue_wait_ms=queue_wait_ms)
+
+
+@task_success.connect
+def on_task_success(sender=None, result=None, **kwargs):
+    if not isinstance(sender, TrackedTask):
+        return
+    if not isinstance(result, dict):
+        result = {"result": result}
+    transition(sender.request.id, "DONE", {**result, "progress": 100})
+
+
+@task_failure.connect
+def on_task_failure(sender=None, task_id=None, exception=None, **kwargs):
+    logger.error(f"Task {task_id} FAILED with error: {str(exception)}")
+    if not isinstance(sender, TrackedTask):
+        return
+    transition(task_id, "FAILED", {"error": str(exception), "progress": 0})
@@ -0,0 +1,80 @@
+"""
+Single-flight execution: identical tasks running at the same time share one
+execution.
+
+The first run to take the flight's Redis lock (the leader) does the work and
+leaves its result under the flight's result key for
+TASK_SINGLE_FLIGHT_RESULT_MS. Runs arriving meanwhile (followers) wait for
+that result and return it as their own, so it lands in their own Task rows
+without touching the data again. If the leader fails or its lock expires
+(TASK_SINGLE_FLIGHT_TIMEOUT_MS) without a result, each follower does the work
+itself; if Redis is unavailable, every run does.
+
+Only meant for reads: a follower may be handed a result computed up to
+TASK_SINGLE_FLIGHT_RESULT_MS before it started.
+"""
+import json
+import logging
+import time
+from django.conf import settings
+from redis.exceptions import RedisError
+from .redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+FLIGHT_LOCK_KEY = "task:flight:{}:lock"
+FLIGHT_RESULT_KEY = "task:flight:{}:result"
+POLL_INTERVAL = 0.05
+
+
+def _shared_result(client, flight):
+    raw = client.get(FLIGHT_RESULT_KEY.format(flight))
+    return json.loads(raw) if raw is not None else None
+
+
+def run_once(flight, fn):
+    """
+    Return fn(), or the result of the identical flight already in progress
+    """
+    timeout_ms = settings.TASK_SINGLE_FLIGHT_TIMEOUT_MS
+    try:
+        client = get_redis()
+        result = _shared_result(client, flight)
+        if result is not None:
+            return result
+        leader = client.set(FLIGHT_LOCK_KEY.format(flight), "1", nx=True, px=timeout_ms)
+    except RedisError as e:
+        logger.warning(f"Single-flight unavailable: {e}")
+        return fn()
+
+    if leader:
+        try:
+            result = fn()
+            try:
+                client.set(FLIGHT_RESULT_KEY.format(flight), json.dumps(result),
+                           px=settings.TASK_SINGLE_FLIGHT_RESULT_MS)
+            except RedisError as e:
+                logger.warning(f"Could not share single-flight result: {e}")
+            return result
+        finally:
+            try:
+                client.delete(FLIGHT_LOCK_KEY.format(flight))
+            except RedisError:
+                pass
+
+    deadline = time.monotonic() + timeout_ms / 1000
+    try:
+        while time.monotonic() < deadline:
+            pipe = client.pipeline(transaction=False)
+            pipe.get(FLIGHT_RESULT_KEY.format(flight))
+            pipe.exists(FLIGHT_LOCK_KEY.format(flight))
+            raw, in_flight = pipe.execute()
+            if raw is not None:
+                return json.loads(raw)
+            if not in_flight:
+                break
+            time.sleep(POLL_INTERVAL)
+    except RedisError as e:
+        logger.warning(f"Single-flight wait failed: {e}")
+    # The leader gave up without a result
+    return fn()
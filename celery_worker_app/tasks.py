@@ -0,0 +1,37 @@
+from celery import shared_task
+from celery.utils.log import get_task_logger
+from django.conf import settings
+from .dispatch import relay_pending
+from .retention import apply_retention
+
+logger = get_task_logger(__name__)
+
+@shared_task
+def maintain_task_partitions():
+    """
+    Periodic (Celery beat) job: create upcoming Task partitions and drop,
+    optionally archiving, the ones past TASK_RETENTION_DAYS
+    """
+    summary = apply_retention(
+        settings.TASK_RETENTION_DAYS,
+        settings.TASK_PARTITION_DAYS_AHEAD,
+        settings.TASK_ARCHIVE_DIR or None
+    )
+    logger.info(f"Task retention: {summary}")
+    return summary
+
+@shared_task
+def republish_undispatched_tasks():
+    """
+    Periodic (Celery beat) job: publish tasks still undispatched after
+    TASK_DISPATCH_GRACE_SECONDS, whose on-commit publish failed
+    """
+    published = 0
+    while True:
+        batch = relay_pending(settings.TASK_OUTBOX_BATCH_SIZE, settings.TASK_DISPATCH_GRACE_SECONDS)
+        published += batch
+        if batch < settings.TASK_OUTBOX_BATCH_SIZE:
+            break
+    if published:
+        logger.warning(f"Republished {published} undispatched tasks")
+    return published
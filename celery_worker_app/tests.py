@@ -1,3 +1,270 @@
-from django.test import TestCase
+import gzip
+import json
+import os
+import tempfile
+import uuid
+from datetime import datetime, time, timedelta, timezone as dt_timezone
+from unittest import mock, skipUnless
+from django.db import connection, transaction
+from django.db.migrations.executor import MigrationExecutor
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from redis.exceptions import RedisError
+from user_app.tasks import get_user, update_user
+from .dispatch import enqueue, relay_pending, replay
+from .idempotency import IdempotencyKeyReused, claim, fingerprint_key, idempotency_key_for, release
+from .models import Task
+from .partitions import DEFAULT_PARTITION, PARENT_TABLE, ensure_partitions, is_partitioned, list_partitions, partition_name
+from .redis_client import get_redis
+from .retention import apply_retention
+from .signals import on_task_prerun, on_task_success, transition
+from .tasks import maintain_task_partitions
 
-# Create your tests here.
+APP = 'celery_worker_app'
+BEFORE_PARTITIONING = (APP, '0002_task_outbox')
+PARTITIONED = (APP, '0003_partition_task_by_created_at')
+
+
+def migrate(target):
+    executor = MigrationExecutor(connection)
+    executor.migrate([target])
+    return executor.loader.project_state([target]).apps
+
+
+def latest():
+    return MigrationExecutor(connection).loader.graph.leaf_nodes(APP)[0]
+
+
+def count(table, task_id):
+    with connection.cursor() as cursor:
+        cursor.execute(f"SELECT count(*) FROM {table} WHERE id = %s", [task_id])
+        return cursor.fetchone()[0]
+
+
+def primary_key(table):
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT a.attname FROM pg_index i
+            JOIN pg_attribute a ON a.attrelid = i.indrelid AND a.attnum = ANY(i.indkey)
+            WHERE i.indrelid = %s::regclass AND i.indisprimary
+            ORDER BY a.attname
+            """,
+            [table]
+        )
+        return [name for (name,) in cursor.fetchall()]
+
+
+def redis_available():
+    try:
+        return get_redis().ping()
+    except RedisError:
+        return False
+
+
+def create_task(created_at, status='DONE'):
+    """
+    A Task row created at created_at (auto_now_add ignores the value on create)
+    """
+    task = Task.objects.create(id=str(uuid.uuid4()), task_name='test', status=status)
+    Task.objects.filter(id=task.id).update(created_at=created_at)
+    return task.id
+
+
+@skipUnless(connection.vendor == 'postgresql', "Task partitioning is PostgreSQL only")
+class TaskPartitioningTests(TransactionTestCase):
+    def test_migration_round_trip(self):
+        self.addCleanup(migrate, latest())
+        old_row = timezone.now() - timedelta(days=3)
+
+        apps = migrate(BEFORE_PARTITIONING)
+        self.assertFalse(is_partitioned())
+        task = apps.get_model(APP, 'Task').objects.create(id=str(uuid.uuid4()), task_name='test')
+        apps.get_model(APP, 'Task').objects.filter(id=task.id).update(created_at=old_row)
+
+        migrate(PARTITIONED)
+        self.assertTrue(is_partitioned())
+        self.assertEqual(primary_key(PARENT_TABLE), ['created_at', 'id'])
+        self.assertEqual(count(f"{PARENT_TABLE}_legacy", task.id), 1)
+        today = datetime.now(dt_timezone.utc).date()
+        self.assertIn(partition_name(today), [name for name, _, _ in list_partitions()])
+
+        migrate(latest())
+        self.assertEqual(Task.objects.get(id=task.id).created_at, old_row)
+
+        migrate(BEFORE_PARTITIONING)
+        self.assertFalse(is_partitioned())
+        self.assertEqual(primary_key(PARENT_TABLE), ['id'])
+        self.assertEqual(count(PARENT_TABLE, task.id), 1)
+
+    def test_ensure_partitions_moves_rows_out_of_default(self):
+        day = datetime.now(dt_timezone.utc).date() + timedelta(days=60)
+        task_id = create_task(datetime.combine(day, time(12), tzinfo=dt_timezone.utc))
+        self.assertEqual(count(DEFAULT_PARTITION, task_id), 1)
+
+        self.assertEqual(ensure_partitions(0, today=day), [partition_name(day)])
+        self.assertEqual(count(DEFAULT_PARTITION, task_id), 0)
+        self.assertEqual(count(partition_name(day), task_id), 1)
+        self.assertEqual(ensure_partitions(0, today=day), [])
+
+    def test_apply_retention_archives_and_drops_expired_partitions(self):
+        self.addCleanup(migrate, latest())
+        # Start from the migration's partitions: a legacy one before today, daily ones after
+        migrate(BEFORE_PARTITIONING)
+        migrate(latest())
+        expired_id = create_task(timezone.now() - timedelta(days=3))
+        kept_id = create_task(timezone.now())
+
+        with tempfile.TemporaryDirectory() as archive_dir:
+            summary = apply_retention(0, 1, archive_dir)
+            with gzip.open(os.path.join(archive_dir, f"{PARENT_TABLE}_legacy.jsonl.gz"), 'rt') as archive:
+                archived = [json.loads(line)['id'] for line in archive]
+
+        self.assertEqual(summary['dropped'], [f"{PARENT_TABLE}_legacy"])
+        self.assertEqual(archived, [expired_id])
+        self.assertFalse(Task.objects.filter(id=expired_id).exists())
+        self.assertTrue(Task.objects.filter(id=kept_id).exists())
+
+
+@skipUnless(redis_available(), "Task deduplication needs Redis")
+class IdempotencyTests(TestCase):
+    def setUp(self):
+        # A fresh client per test, so keys and rate buckets never carry over
+        self.client_id = f"test:{uuid.uuid4()}"
+
+    def forget(self, key):
+        self.addCleanup(get_redis().delete, key)
+        return key
+
+    def test_claim_and_release(self):
+        key = self.forget(idempotency_key_for('test', self.client_id, 'key-1'))
+
+        self.assertIsNone(claim(key, 'first', 60))
+        self.assertEqual(claim(key, 'second', 60), 'first')
+        release(key, 'second')
+        self.assertEqual(claim(key, 'second', 60), 'first')
+        release(key, 'first')
+        self.assertIsNone(claim(key, 'second', 60))
+
+    def test_claim_refuses_a_key_reused_for_another_request(self):
+        key = self.forget(idempotency_key_for('test', self.client_id, 'key-1'))
+
+        self.assertIsNone(claim(key, 'first', 60, request_digest='a'))
+        self.assertEqual(claim(key, 'second', 60, request_digest='a'), 'first')
+        with self.assertRaises(IdempotencyKeyReused):
+            claim(key, 'second', 60, request_digest='b')
+
+    def test_replay_returns_the_same_task(self):
+        self.forget(idempotency_key_for(update_user.name, self.client_id, 'key-1'))
+        user_id = str(uuid.uuid4())
+        fields = dict(operation='UPDATE', idempotency_key='key-1', request_digest='a', client_id=self.client_id)
+
+        first = enqueue(update_user, [user_id, {"first_name": "A"}], **fields)
+        second = enqueue(update_user, [user_id, {"first_name": "A"}], **fields)
+
+        self.assertFalse(first.replayed)
+        self.assertTrue(second.replayed)
+        self.assertEqual(second.id, first.id)
+        self.assertEqual(replay(update_user, 'key-1', self.client_id, 'a').id, first.id)
+        self.assertEqual(Task.objects.filter(client_id=self.client_id).count(), 1)
+
+    def test_writes_without_a_key_are_not_deduplicated(self):
+        user_id = str(uuid.uuid4())
+        tasks = [
+            enqueue(update_user, [user_id, {"first_name": name}], operation='UPDATE', client_id=self.client_id)
+            for name in ("A", "B", "A")
+        ]
+
+        self.assertFalse(any(task.replayed for task in tasks))
+        self.assertEqual(len({task.id for task in tasks}), 3)
+
+    def test_identical_reads_share_a_task(self):
+        user_id = str(uuid.uuid4())
+        self.forget(fingerprint_key(get_user.name, [user_id], {}))
+
+        first = enqueue(get_user, [user_id], operation='READ', client_id=self.client_id)
+        second = enqueue(get_user, [user_id], operation='READ', client_id=self.client_id)
+
+        self.assertTrue(second.replayed)
+        self.assertEqual(second.id, first.id)
+
+
+@mock.patch('celery_worker_app.dispatch.publish')
+class DispatchTests(TestCase):
+    def enqueue(self):
+        return enqueue(update_user, [str(uuid.uuid4()), {"first_name": "A"}], operation='UPDATE')
+
+    def test_publishes_only_after_commit(self, publish):
+        with self.captureOnCommitCallbacks(execute=True):
+            task = self.enqueue()
+            publish.assert_not_called()
+
+        publish.assert_called_once()
+        self.assertEqual([message["id"] for message in publish.call_args.args[0]], [task.id])
+        row = Task.objects.get(id=task.id)
+        self.assertIsNotNone(row.dispatched_at)
+        self.assertIsNone(row.dispatch_payload)
+
+    def test_rollback_publishes_nothing(self, publish):
+        with self.captureOnCommitCallbacks(execute=True):
+            with self.assertRaises(RuntimeError):
+                with transaction.atomic():
+                    task = self.enqueue()
+                    raise RuntimeError("request failed")
+
+        publish.assert_not_called()
+        self.assertFalse(Task.objects.filter(id=task.id).exists())
+
+    def test_failed_publish_is_left_to_the_outbox(self, publish):
+        publish.side_effect = ConnectionError("broker down")
+        with self.assertLogs('celery_worker_app.dispatch', 'WARNING'):
+            with self.captureOnCommitCallbacks(execute=True):
+                task = self.enqueue()
+
+        row = Task.objects.get(id=task.id)
+        self.assertIsNone(row.dispatched_at)
+        self.assertEqual(row.dispatch_payload["id"], task.id)
+
+    @override_settings(TASK_DISPATCH_MODE='relay')
+    def test_relay_publishes_undispatched_rows(self, publish):
+        with self.captureOnCommitCallbacks() as callbacks:
+            tasks = [self.enqueue(), self.enqueue()]
+        self.assertEqual(callbacks, [])
+
+        self.assertEqual(relay_pending(10), 2)
+        task_ids = sorted(task.id for task in tasks)
+        self.assertEqual(sorted(message["id"] for message in publish.call_args.args[0]), task_ids)
+        self.assertFalse(Task.objects.filter(id__in=task_ids, dispatched_at__isnull=True).exists())
+        self.assertEqual(relay_pending(10), 0)
+
+
+class TransitionTests(TestCase):
+    def status(self, task_id):
+        return Task.objects.get(id=task_id).status
+
+    def test_late_prerun_does_not_reopen_finished_tasks(self):
+        for status in ("DONE", "FAILED"):
+            task_id = create_task(timezone.now(), status=status)
+            self.assertFalse(transition(task_id, "PROCESSING"))
+            self.assertEqual(self.status(task_id), status)
+
+    def test_failure_after_success_is_rejected(self):
+        task_id = create_task(timezone.now(), status='PROCESSING')
+
+        self.assertTrue(transition(task_id, "DONE", {"progress": 100}))
+        self.assertFalse(transition(task_id, "FAILED", {"error": "late", "progress": 0}))
+        task = Task.objects.get(id=task_id)
+        self.assertEqual((task.status, task.result), ("DONE", {"progress": 100}))
+
+    def test_untracked_tasks_skip_the_update(self):
+        with self.assertNumQueries(0):
+            on_task_prerun(task_id=str(uuid.uuid4()), task=maintain_task_partitions)
+            on_task_success(sender=maintain_task_partitions, result={"created": []})
+
+    def test_retried_runs_skip_the_update(self):
+        task_id = create_task(timezone.now(), status='PROCESSING')
+        update_user.push_request(id=task_id, retries=1)
+        self.addCleanup(update_user.pop_request)
+
+        with self.assertNumQueries(0):
+            on_task_prerun(task_id=task_id, task=update_user)
@@ -1,10 +1,11 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import TaskViewSet
+from .views import TaskViewSet, task_events
 
 router = DefaultRouter()
 router.register(r'', TaskViewSet)
 
 urlpatterns = [
+    path('<str:pk>/events/', task_events, name='task-events'),
     path('', include(router.urls)),
 ]
\ No newline at end of file
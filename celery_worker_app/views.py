@@ -1,9 +1,23 @@
+import json
+import logging
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from prometheus_client import CONTENT_TYPE_LATEST
+import redis.asyncio as aioredis
+from redis.exceptions import RedisError
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
-from celery.result import AsyncResult
-from .models import Task
-from .serializers import TaskSerializer, TaskListSerializer
+from .conditional import conditional_response, is_fresh, not_modified, tagged, task_cache_control, version_etag
+from .events import CHANNEL, STATE_KEY, TERMINAL_STATUSES, task_event
+from .metrics import export
+from .models import ACTIVE_STATUSES, Task
+from .pagination import TaskCursorPagination
+from .redis_client import get_redis
+from .serializers import TASK_FIELDS, TaskSerializer, task_row, task_values
+
+logger = logging.getLogger(__name__)
 
 class TaskViewSet(viewsets.ReadOnlyModelViewSet):
     """
@@ -12,44 +26,214 @@ class TaskViewSet(viewsets.ReadOnlyModelViewSet):
     """
     queryset = Task.objects.all()
     serializer_class = TaskSerializer
-    
-    def get_serializer_class(self):
-        if self.action == 'list':
-            return TaskListSerializer
-        return TaskSerializer
-    
+    pagination_class = TaskCursorPagination
+    filter_fields = ('status', 'task_name', 'related_table', 'related_id', 'operation', 'client_id')
+
+    def get_queryset(self):
+        """
+        Filter the task list by query parameters. Each filter accepts a
+        comma-separated list of values; ?active=1 limits the list to
+        unfinished tasks.
+        """
+        queryset = super().get_queryset()
+        if self.action != 'list':
+            return queryset
+
+        params = self.request.query_params
+        for field in self.filter_fields:
+            value = params.get(field)
+            if not value:
+                continue
+            values = [v for v in value.split(',') if v]
+            if len(values) == 1:
+                queryset = queryset.filter(**{field: values[0]})
+            else:
+                queryset = queryset.filter(**{f"{field}__in": values})
+
+        if params.get('active', '').lower() in ('true', '1', 'yes'):
+            queryset = queryset.filter(status__in=ACTIVE_STATUSES)
+        return queryset
+
+    def list(self, request):
+        """
+        One page of tasks, built from plain rows without the payload columns
+        """
+        page = self.paginate_queryset(task_values(self.get_queryset()))
+        return self.get_paginated_response([task_row(row) for row in page])
+
+    def retrieve(self, request, pk=None):
+        return self._task_response(request, pk)
+
     @action(detail=True, methods=['get'])
     def status(self, request, pk=None):
         """
-        Get the status of a task
+        Get the status of a task. Status is kept up to date by the worker
+        (see signals.py), so this is a single primary-key read.
         """
-        try:
-            task = Task.objects.get(id=pk)
-        except Task.DoesNotExist:
+        return self._task_response(request, pk)
+
+    def _task_response(self, request, pk):
+        """
+        The task, tagged with an ETag from updated_at (see conditional.py).
+        If the client's If-None-Match is current the answer is an empty 304,
+        found by reading only the row's status and updated_at.
+        """
+        if request.headers.get("If-None-Match"):
+            version = Task.objects.filter(id=pk).values_list('status', 'updated_at').first()
+            if version is not None and is_fresh(request, version_etag(version[1])):
+                return not_modified(version_etag(version[1]), task_cache_control(version[0]))
+
+        task = task_values(Task.objects.filter(id=pk), TASK_FIELDS).first()
+        if task is None:
             return Response(
-                {"detail": "Task not found"}, 
+                {"detail": "Task not found"},
                 status=status.HTTP_404_NOT_FOUND
             )
-        
-        # Get the latest status from Celery
-        task_result = AsyncResult(pk)
-        
-        # Update the task status in the database if it has changed
-        celery_status = task_result.status
-        if task.status != celery_status:
-            if celery_status == "PENDING":
-                task.status = "PENDING"
-            elif celery_status == "STARTED":
-                task.status = "PROCESSING"
-            elif celery_status == "SUCCESS":
-                task.status = "DONE"
-                if task_result.ready():
-                    task.result = task_result.get()
-            else:
-                task.status = celery_status
-                
-            task.save()
-        
-        # Prepare the response
-        serializer = TaskSerializer(task)
-        return Response(serializer.data)
\ No newline at end of file
+
+        response = Response(task_row(task))
+        return tagged(response, version_etag(task['updated_at']), task_cache_control(task['status']))
+
+    @action(detail=False, methods=['get', 'post'], url_path='status')
+    def status_batch(self, request):
+        """
+        Status and progress of many tasks at once, as {id: {status, progress}}
+        (null for unknown ids). Ids come from ?ids=a,b,c or a POST body of
+        {"ids": [...]}. Answered with an empty 304 if the client's
+        If-None-Match already matches the statuses.
+        """
+        if request.method == 'POST':
+            ids = request.data.get("ids") if isinstance(request.data, dict) else request.data
+        else:
+            ids = [pk for pk in request.query_params.get("ids", "").split(",") if pk]
+
+        if not isinstance(ids, list) or not ids or not all(isinstance(pk, str) for pk in ids):
+            return Response(
+                {"detail": "Provide task ids as ?ids=a,b,c or {\"ids\": [...]}"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        ids = list(dict.fromkeys(ids))
+        if len(ids) > settings.TASK_STATUS_BATCH_MAX_IDS:
+            return Response(
+                {"detail": f"At most {settings.TASK_STATUS_BATCH_MAX_IDS} task ids per request"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        return conditional_response(request, _task_statuses(ids))
+
+
+def _task_statuses(ids):
+    """
+    {id: {"status", "progress"}} for the given task ids, None for unknown ones.
+    Snapshots are read from Redis in one MGET; tasks without one (not started
+    yet, or older than TASK_EVENTS_TTL) are read from PostgreSQL in one query.
+    """
+    statuses = dict.fromkeys(ids)
+    try:
+        snapshots = get_redis().mget([STATE_KEY.format(pk) for pk in ids])
+    except RedisError:
+        snapshots = [None] * len(ids)
+    for pk, raw in zip(ids, snapshots):
+        if raw is not None:
+            snapshot = json.loads(raw)
+            statuses[pk] = {"status": snapshot["status"], "progress": snapshot["progress"]}
+
+    missing = [pk for pk, value in statuses.items() if value is None]
+    if missing:
+        rows = Task.objects.filter(id__in=missing).values_list('id', 'status', 'result__progress')
+        for pk, task_status, progress in rows:
+            statuses[str(pk)] = {"status": task_status, "progress": progress or 0}
+    return statuses
+
+
+def _load_event(pk):
+    """
+    The task's current event from the database, for tasks whose snapshot is
+    not (or no longer) in Redis and for finished ones, whose result is not
+    """
+    task = Task.objects.filter(id=pk).first()
+    return json.dumps(task_event(task)) if task else None
+
+
+def _sse(payload):
+    return f"event: progress\ndata: {payload}\n\n"
+
+
+async def _database_event(pk, error):
+    # Without Redis there are no updates to follow: the stream sends the
+    # current state from the database and ends, and the client's EventSource
+    # reconnects
+    logger.warning(f"Task events unavailable, sending task {pk} from the database: {error}")
+    return await sync_to_async(_load_event)(pk)
+
+
+async def _event_stream(client, pk):
+    pubsub = client.pubsub()
+    try:
+        # Subscribe before reading the snapshot so no update can slip in between
+        try:
+            await pubsub.subscribe(CHANNEL.format(pk))
+            snapshot = await client.get(STATE_KEY.format(pk))
+        except RedisError as e:
+            payload = await _database_event(pk, e)
+            if payload is not None:
+                yield _sse(payload)
+            return
+        if snapshot is None or json.loads(snapshot)["status"] in TERMINAL_STATUSES:
+            snapshot = await sync_to_async(_load_event)(pk)
+            if snapshot is None:
+                return
+        payload = snapshot.decode() if isinstance(snapshot, bytes) else snapshot
+        yield _sse(payload)
+
+        while json.loads(payload)["status"] not in TERMINAL_STATUSES:
+            try:
+                message = await pubsub.get_message(
+                    ignore_subscribe_messages=True,
+                    timeout=settings.TASK_EVENTS_HEARTBEAT
+                )
+            except RedisError as e:
+                payload = await _database_event(pk, e)
+                if payload is not None:
+                    yield _sse(payload)
+                return
+            if message is None:
+                # Comment line keeps proxies from closing an idle connection
+                yield ": keep-alive\n\n"
+                continue
+            payload = message["data"].decode()
+            yield _sse(payload)
+    finally:
+        await pubsub.aclose()
+        await client.aclose()
+
+
+async def task_events(request, pk):
+    """
+    Stream a task's status and progress as Server-Sent Events until it finishes.
+    Needs an ASGI server (the web-events service); under WSGI the response is
+    buffered until the task is done.
+    """
+    # Only the connect timeout: the stream waits on pub/sub for longer than a command would
+    client = aioredis.from_url(settings.REDIS_URL, socket_connect_timeout=settings.REDIS_SOCKET_TIMEOUT)
+    try:
+        known = await client.exists(STATE_KEY.format(pk))
+    except RedisError as e:
+        logger.warning(f"Could not look up task {pk} in Redis: {e}")
+        known = False
+    if not known and not await sync_to_async(Task.objects.filter(id=pk).exists)():
+        await client.aclose()
+        return JsonResponse({"detail": "Task not found"}, status=404)
+
+    response = StreamingHttpResponse(_event_stream(client, pk), content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    # Stop nginx and similar proxies from buffering the stream
+    response["X-Accel-Buffering"] = "no"
+    return response
+
+
+def metrics(request):
+    """
+    Prometheus metrics for the web app, the task backlog and (with
+    PROMETHEUS_MULTIPROC_DIR) every server process; see metrics.py
+    """
+    return HttpResponse(export(), content_type=CONTENT_TYPE_LATEST)
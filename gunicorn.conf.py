@@ -0,0 +1,61 @@
+"""
+Gunicorn settings for the web service (read automatically from the working
+directory, so `gunicorn` alone starts the app).
+
+SERVER_MODE picks the interface:
+
+    wsgi  threaded sync workers running task_project.wsgi (default); best for
+          the REST API
+    asgi  uvicorn workers running task_project.asgi; needed to hold many
+          task progress streams (/api/tasks/{id}/events/) open at once
+
+The app is loaded once in the master (preload_app) and shared copy-on-write
+by the forked workers.
+"""
+import gc
+import multiprocessing
+import os
+import shutil
+
+SERVER_MODE = os.environ.get('SERVER_MODE', 'wsgi')
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:8000')
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+
+if SERVER_MODE == 'asgi':
+    wsgi_app = 'task_project.asgi:application'
+    worker_class = 'uvicorn.workers.UvicornWorker'
+else:
+    wsgi_app = 'task_project.wsgi:application'
+    worker_class = 'gthread'
+    threads = int(os.environ.get('GUNICORN_THREADS', '4'))
+
+# Reloading on code changes (development) needs the app loaded in the workers
+reload = os.environ.get('GUNICORN_RELOAD', 'False').lower() in ('true', '1', 'yes')
+preload_app = not reload
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', '30'))
+keepalive = int(os.environ.get('GUNICORN_KEEPALIVE', '5'))
+# Recycle workers now and then so slow leaks cannot build up
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', '2000'))
+max_requests_jitter = max_requests // 10
+accesslog = '-'
+
+
+def on_starting(server):
+    # With PROMETHEUS_MULTIPROC_DIR the workers share their metrics through
+    # files there; files from a previous run would be counted again
+    path = os.environ.get('PROMETHEUS_MULTIPROC_DIR')
+    if path:
+        shutil.rmtree(path, ignore_errors=True)
+        os.makedirs(path, exist_ok=True)
+
+
+def when_ready(server):
+    # The app is loaded by now and the workers are about to fork. Connections
+    # must not be shared with the workers, and freezing the loaded objects
+    # keeps the garbage collector from touching (and so copying) their pages.
+    if not preload_app:
+        return
+    from django.db import connections
+    connections.close_all()
+    gc.freeze()
@@ -35,6 +35,10 @@ python manage.py makemigrations
 Write-Host "Running migrations..."
 python manage.py migrate
 
+# Collect static files for WhiteNoise to serve
+Write-Host "Collecting static files..."
+python manage.py collectstatic --noinput
+
 # Create superuser if specified in environment variables
 if ($env:DJANGO_SUPERUSER_USERNAME -and $env:DJANGO_SUPERUSER_EMAIL -and $env:DJANGO_SUPERUSER_PASSWORD) {
     Write-Host "Creating superuser..."
@@ -43,4 +47,9 @@ if ($env:DJANGO_SUPERUSER_USERNAME -and $env:DJANGO_SUPERUSER_EMAIL -and $env:DJ
 
 # Execute the command passed as arguments
 Write-Host "Starting application with command: $args"
-& $args[0] $args[1..($args.Length-1)]
\ No newline at end of file
+# $args[1..0] would repeat the command itself, so only splat when there are arguments
+if ($args.Length -gt 1) {
+    & $args[0] $args[1..($args.Length-1)]
+} else {
+    & $args[0]
+}
@@ -2,6 +2,8 @@
 ASGI config for task_project project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+Serve it with an ASGI server (e.g. ``uvicorn task_project.asgi:application``)
+to stream task progress from ``/api/tasks/{id}/events/``.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/4.2/howto/deployment/asgi/
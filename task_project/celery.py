@@ -1,9 +1,22 @@
+import gzip
 import os
 from celery import Celery
+from kombu.serialization import register
+from kombu.utils.json import dumps, loads
 
 # Set the default Django settings module
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'task_project.settings')
 
+# Serializer for task results kept in the result backend (CELERY_RESULT_SERIALIZER):
+# JSON, gzipped, since Celery only compresses results for the RPC backend
+register(
+    'json-gzip',
+    lambda obj: gzip.compress(dumps(obj).encode()),
+    lambda data: loads(gzip.decompress(data)),
+    content_type='application/x-json-gzip',
+    content_encoding='binary',
+)
+
 # Create Celery app
 app = Celery('task_project')
 
@@ -12,6 +12,7 @@ https://docs.djangoproject.com/en/4.2/ref/settings/
 
 from pathlib import Path
 import os
+from celery.schedules import crontab
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -21,12 +22,13 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 # See https://docs.djangoproject.com/en/4.2/howto/deployment/checklist/
 
 # SECURITY WARNING: keep the secret key used in production secret!
-SECRET_KEY = 'django-insecure-!ide^qn!62e*!ka#o_aarh2oy!pfi6+thz7gor7@so@@j@_w*='
+SECRET_KEY = os.environ.get('SECRET_KEY', 'django-insecure-!ide^qn!62e*!ka#o_aarh2oy!pfi6+thz7gor7@so@@j@_w*=')
 
 # SECURITY WARNING: don't run with debug turned on in production!
-DEBUG = True
+# DEBUG also keeps every SQL query in memory.
+DEBUG = os.environ.get('DEBUG', 'False').lower() in ('true', '1', 'yes')
 
-ALLOWED_HOSTS = []
+ALLOWED_HOSTS = [host.strip() for host in os.environ.get('ALLOWED_HOSTS', 'localhost,127.0.0.1').split(',') if host.strip()]
 
 
 # Application definition
@@ -48,6 +50,10 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    # Serves collected static files with far-future caching and compression
+    'whitenoise.middleware.WhiteNoiseMiddleware',
+    # Request time and database queries per view (GET /metrics)
+    'celery_worker_app.metrics.MetricsMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -88,9 +94,19 @@ DATABASES = {
         'PASSWORD': os.environ.get('DATABASE_PASSWORD', 'postgres'),
         'HOST': os.environ.get('DATABASE_HOST', 'postgres'),
         'PORT': os.environ.get('DATABASE_PORT', '5432'),
+        # Keep connections open between requests and tasks for this many
+        # seconds, checking them before reuse; 0 closes them after each one
+        'CONN_MAX_AGE': int(os.environ.get('DATABASE_CONN_MAX_AGE', '60')),
+        'CONN_HEALTH_CHECKS': True,
+        # Server-side cursors do not survive PgBouncer's transaction pooling
+        'DISABLE_SERVER_SIDE_CURSORS': os.environ.get('DATABASE_PGBOUNCER', 'False').lower() in ('true', '1', 'yes'),
     }
 }
 
+# Seconds between each process's database connection stats reports
+# (see celery_worker_app/db_connections.py and `manage.py connection_stats`)
+DB_CONNECTION_STATS_INTERVAL = int(os.environ.get('DB_CONNECTION_STATS_INTERVAL', '30'))
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
@@ -127,6 +143,25 @@ USE_TZ = True
 # https://docs.djangoproject.com/en/4.2/howto/static-files/
 
 STATIC_URL = 'static/'
+STATIC_ROOT = BASE_DIR / 'staticfiles'
+
+STORAGES = {
+    'default': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    },
+    'staticfiles': {
+        # Hashed, pre-compressed files from `manage.py collectstatic`
+        'BACKEND': 'whitenoise.storage.CompressedManifestStaticFilesStorage',
+    },
+}
+
+# API responses are rendered with orjson (celery_worker_app/renderers.py)
+REST_FRAMEWORK = {
+    'DEFAULT_RENDERER_CLASSES': [
+        'celery_worker_app.renderers.ORJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+}
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
@@ -138,8 +173,159 @@ CELERY_BROKER_URL = os.environ.get('CELERY_BROKER_URL', 'redis://redis:6379/0')
 CELERY_RESULT_BACKEND = os.environ.get('CELERY_RESULT_BACKEND', 'redis://redis:6379/0')
 CELERY_ACCEPT_CONTENT = ['json']
 CELERY_TASK_SERIALIZER = 'json'
-CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = TIME_ZONE
 
+# Task rows in PostgreSQL are the only record of task results the API reads,
+# so by default Celery stores nothing in the result backend. Tasks that do
+# store results (CELERY_TASK_IGNORE_RESULT=False, or ignore_result=False on
+# the task) have them stored as gzipped JSON (registered in celery.py) and
+# expired after CELERY_RESULT_EXPIRES seconds.
+CELERY_TASK_IGNORE_RESULT = os.environ.get('CELERY_TASK_IGNORE_RESULT', 'True').lower() in ('true', '1', 'yes')
+CELERY_RESULT_EXPIRES = int(os.environ.get('CELERY_RESULT_EXPIRES', '3600'))
+CELERY_RESULT_SERIALIZER = 'json-gzip'
+CELERY_RESULT_ACCEPT_CONTENT = ['json', 'json-gzip']
+
+# Queue routing: reads, writes and bulk jobs go to separate queues so a burst
+# of one never waits behind another, and the beat maintenance jobs get a queue
+# and worker of their own so a write backlog can never delay them; anything
+# else uses the default 'celery' queue. Exact task names win over the
+# patterns, and patterns are tried in order. With Redis, priority 0 is the highest.
+CELERY_TASK_ROUTES = {
+    'user_app.tasks.get_user': {'queue': 'reads', 'priority': 0},
+    'user_app.tasks.list_users': {'queue': 'reads', 'priority': 0},
+    'user_app.tasks.bulk_*': {'queue': 'bulk', 'priority': 6},
+    'user_app.tasks.*': {'queue': 'writes', 'priority': 3},
+    'celery_worker_app.tasks.*': {'queue': 'maintenance'},
+}
+CELERY_TASK_DEFAULT_PRIORITY = 3
+CELERY_BROKER_TRANSPORT_OPTIONS = {
+    'priority_steps': list(range(10)),
+    'sep': ':',
+    # A worker consuming several queues drains them in the order given to -Q
+    'queue_order_strategy': 'priority',
+}
+
+# Worker tuning; each worker profile in docker-compose.yml overrides these.
+# Late acks return a task to the queue if its worker dies mid-run.
+CELERY_TASK_ACKS_LATE = os.environ.get('CELERY_TASK_ACKS_LATE', 'True').lower() in ('true', '1', 'yes')
+CELERY_WORKER_PREFETCH_MULTIPLIER = int(os.environ.get('CELERY_WORKER_PREFETCH_MULTIPLIER', '1'))
+
+# Port each worker serves its Prometheus metrics on (0 turns it off)
+WORKER_METRICS_PORT = int(os.environ.get('WORKER_METRICS_PORT', '0'))
+
+# Redis used directly by the apps (caching etc.), the broker's instance by default
+REDIS_URL = os.environ.get('REDIS_URL', CELERY_BROKER_URL)
+# Seconds to wait for Redis to connect or answer before carrying on without it
+REDIS_SOCKET_TIMEOUT = float(os.environ.get('REDIS_SOCKET_TIMEOUT', '1'))
+
+# Task progress events (GET /api/tasks/{id}/events/)
+TASK_EVENTS_TTL = int(os.environ.get('TASK_EVENTS_TTL', '3600'))
+TASK_EVENTS_HEARTBEAT = int(os.environ.get('TASK_EVENTS_HEARTBEAT', '15'))
+
+# How long clients and proxies may cache a finished (DONE/FAILED) task
+TASK_TERMINAL_CACHE_SECONDS = int(os.environ.get('TASK_TERMINAL_CACHE_SECONDS', '86400'))
+
+# Most task ids accepted by one batch status request (/api/tasks/status/)
+TASK_STATUS_BATCH_MAX_IDS = int(os.environ.get('TASK_STATUS_BATCH_MAX_IDS', '1000'))
+
+# Milliseconds between task progress writes to PostgreSQL, per task name.
+# Progress still reaches streaming clients through Redis on every update;
+# 0 writes every update through, None writes only on status transitions.
+TASK_PROGRESS_FLUSH_MS = {
+    'default': int(os.environ.get('TASK_PROGRESS_FLUSH_MS', '1000')),
+    'get_user': None,
+    'list_users': None,
+    'bulk_create_users': 2000,
+    'bulk_update_users': 2000,
+    'bulk_delete_users': 2000,
+}
+
+# Task dispatch: 'on_commit' publishes from the web process after the Task row
+# commits; 'relay' leaves publishing to `manage.py run_outbox_relay`
+TASK_DISPATCH_MODE = os.environ.get('TASK_DISPATCH_MODE', 'on_commit')
+TASK_OUTBOX_BATCH_SIZE = int(os.environ.get('TASK_OUTBOX_BATCH_SIZE', '500'))
+TASK_OUTBOX_POLL_INTERVAL = float(os.environ.get('TASK_OUTBOX_POLL_INTERVAL', '0.2'))
+# Rows older than this and still unpublished are republished by Celery beat
+TASK_DISPATCH_GRACE_SECONDS = int(os.environ.get('TASK_DISPATCH_GRACE_SECONDS', '60'))
+
+# Task deduplication (see celery_worker_app/idempotency.py): how long an
+# Idempotency-Key keeps pointing at its task, and the cap on how long an
+# identical request joins a task in flight (0 turns that off)
+TASK_IDEMPOTENCY_KEY_TTL = int(os.environ.get('TASK_IDEMPOTENCY_KEY_TTL', '86400'))
+TASK_DEDUP_TTL = int(os.environ.get('TASK_DEDUP_TTL', '300'))
+
+# Fair scheduling (see celery_worker_app/fairness.py): each client may queue
+# TASK_CLIENT_RATE tasks per second (bursts of TASK_CLIENT_BURST) at normal
+# priority; beyond that its tasks go to the back at TASK_THROTTLED_PRIORITY.
+# 0 turns the rate limit off. Clients are told apart by their authenticated
+# user, else their address; set TASK_CLIENT_ID_HEADER (e.g. 'X-Client-Id') only
+# when a gateway strips that header from requests and sets it itself.
+TASK_CLIENT_RATE = float(os.environ.get('TASK_CLIENT_RATE', '10'))
+TASK_CLIENT_BURST = int(os.environ.get('TASK_CLIENT_BURST', '50'))
+TASK_THROTTLED_PRIORITY = int(os.environ.get('TASK_THROTTLED_PRIORITY', '9'))
+TASK_CLIENT_ID_HEADER = os.environ.get('TASK_CLIENT_ID_HEADER', '')
+
+# Admission control (see celery_worker_app/admission.py): new tasks are refused
+# with 429 (clients over their rate) or 503 and Retry-After once the backlog
+# reaches these limits; 0 turns a limit off. The backlog is re-read at most
+# every TASK_ADMISSION_CACHE_SECONDS per process.
+TASK_ADMISSION_QUEUE_SOFT_LIMIT = int(os.environ.get('TASK_ADMISSION_QUEUE_SOFT_LIMIT', '1000'))
+TASK_ADMISSION_QUEUE_HARD_LIMIT = int(os.environ.get('TASK_ADMISSION_QUEUE_HARD_LIMIT', '5000'))
+TASK_ADMISSION_PENDING_LIMIT = int(os.environ.get('TASK_ADMISSION_PENDING_LIMIT', '20000'))
+TASK_ADMISSION_RETRY_AFTER = int(os.environ.get('TASK_ADMISSION_RETRY_AFTER', '10'))
+TASK_ADMISSION_CACHE_SECONDS = float(os.environ.get('TASK_ADMISSION_CACHE_SECONDS', '2'))
+
+# Single-flight reads (see celery_worker_app/singleflight.py): how long
+# followers wait on a leader, and how long its result is shared
+TASK_SINGLE_FLIGHT_TIMEOUT_MS = int(os.environ.get('TASK_SINGLE_FLIGHT_TIMEOUT_MS', '30000'))
+TASK_SINGLE_FLIGHT_RESULT_MS = int(os.environ.get('TASK_SINGLE_FLIGHT_RESULT_MS', '1000'))
+
+# Task retention: daily partitions are created TASK_PARTITION_DAYS_AHEAD days
+# ahead and dropped after TASK_RETENTION_DAYS, archived first if
+# TASK_ARCHIVE_DIR is set
+TASK_RETENTION_DAYS = int(os.environ.get('TASK_RETENTION_DAYS', '30'))
+TASK_PARTITION_DAYS_AHEAD = int(os.environ.get('TASK_PARTITION_DAYS_AHEAD', '7'))
+TASK_ARCHIVE_DIR = os.environ.get('TASK_ARCHIVE_DIR', '')
+
+# Task list (GET /api/tasks/): cursor paginated, newest first
+TASK_LIST_PAGE_SIZE = int(os.environ.get('TASK_LIST_PAGE_SIZE', '50'))
+TASK_LIST_MAX_PAGE_SIZE = int(os.environ.get('TASK_LIST_MAX_PAGE_SIZE', '500'))
+
+CELERY_BEAT_SCHEDULE = {
+    'maintain-task-partitions': {
+        'task': 'celery_worker_app.tasks.maintain_task_partitions',
+        'schedule': crontab(minute=5),
+    },
+    'republish-undispatched-tasks': {
+        'task': 'celery_worker_app.tasks.republish_undispatched_tasks',
+        'schedule': 60.0,
+    },
+}
+
+# Bulk user operations
+USER_BULK_CHUNK_SIZE = int(os.environ.get('USER_BULK_CHUNK_SIZE', '1000'))
+USER_BULK_MAX_ITEMS = int(os.environ.get('USER_BULK_MAX_ITEMS', '10000'))
+
+# User listing
+USER_LIST_PAGE_SIZE = int(os.environ.get('USER_LIST_PAGE_SIZE', '100'))
+USER_LIST_MAX_PAGE_SIZE = int(os.environ.get('USER_LIST_MAX_PAGE_SIZE', '1000'))
+USER_STREAM_CHUNK_SIZE = int(os.environ.get('USER_STREAM_CHUNK_SIZE', '2000'))
+
+# Answer GET /api/users/ and /api/users/{id}/ inline instead of through Celery.
+# Callers can still choose per request with ?sync= or a Prefer header.
+USER_READS_SYNC = os.environ.get('USER_READS_SYNC', 'False').lower() in ('true', '1', 'yes')
+# Reads are also answered inline while their queue holds this many messages (0 never)
+USER_READS_SYNC_QUEUE_DEPTH = int(os.environ.get('USER_READS_SYNC_QUEUE_DEPTH', '200'))
+
+# User read cache TTLs in seconds
+USER_CACHE_TTL = int(os.environ.get('USER_CACHE_TTL', '300'))
+USER_LIST_CACHE_TTL = int(os.environ.get('USER_LIST_CACHE_TTL', '60'))
+
+# Simulated processing time in the user tasks (see user_app/work.py):
+# 'off', 'fixed' (USER_TASK_WORK_FIXED_MS per step), 'random', or 'deferred'
+# (random durations spent as countdowns rather than holding a worker slot)
+USER_TASK_WORK_PROFILE = os.environ.get('USER_TASK_WORK_PROFILE', 'random')
+USER_TASK_WORK_FIXED_MS = int(os.environ.get('USER_TASK_WORK_FIXED_MS', '500'))
+
 # CORS settings
 CORS_ALLOW_ALL_ORIGINS = True
@@ -16,9 +16,11 @@ Including another URLconf
 """
 from django.contrib import admin
 from django.urls import path, include
+from celery_worker_app.views import metrics
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/tasks/', include('celery_worker_app.urls')),
     path('api/users/', include('user_app.urls')),
+    path('metrics', metrics, name='metrics'),
 ]
\ No newline at end of file
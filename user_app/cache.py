@@ -0,0 +1,119 @@
+"""
+Read-through Redis cache for users.
+
+Single users are cached under their id and invalidated by the write tasks.
+List pages are cached under a generation number that every write bumps, so
+a write invalidates all pages at once without scanning for keys; pages from
+older generations simply expire. Redis errors never fail a read: the cache
+is bypassed and the database answers instead.
+"""
+import json
+import logging
+from django.conf import settings
+from redis.exceptions import RedisError
+from celery_worker_app.redis_client import get_redis
+from .models import User
+from .pagination import USER_FIELDS, clamp_page_size, fetch_page, user_to_dict
+
+logger = logging.getLogger(__name__)
+
+USER_KEY = "user:cache:user:{}"
+LIST_GENERATION_KEY = "user:cache:list-generation"
+LIST_KEY = "user:cache:list:{generation}:{page_size}:{cursor}"
+HITS_KEY = "user:cache:hits"
+MISSES_KEY = "user:cache:misses"
+
+
+def _read(key):
+    try:
+        value = get_redis().get(key)
+    except RedisError as e:
+        logger.warning(f"User cache read failed: {e}")
+        return None
+    try:
+        get_redis().incr(HITS_KEY if value is not None else MISSES_KEY)
+    except RedisError:
+        pass
+    return json.loads(value) if value is not None else None
+
+
+def _write(key, value, ttl):
+    try:
+        get_redis().set(key, json.dumps(value), ex=ttl)
+    except RedisError as e:
+        logger.warning(f"User cache write failed: {e}")
+
+
+def _list_generation():
+    try:
+        return int(get_redis().get(LIST_GENERATION_KEY) or 0)
+    except RedisError as e:
+        logger.warning(f"User cache read failed: {e}")
+        return None
+
+
+def cached_user(user_id):
+    """
+    Return the user as a dict, or None if it does not exist
+    """
+    key = USER_KEY.format(user_id)
+    data = _read(key)
+    if data is not None:
+        return data
+
+    row = User.objects.filter(id=user_id).values(*USER_FIELDS).first()
+    if row is None:
+        return None
+    data = user_to_dict(row)
+    _write(key, data, settings.USER_CACHE_TTL)
+    return data
+
+
+def cached_page(cursor=None, page_size=None):
+    """
+    Return one keyset page of users (see pagination.fetch_page)
+    """
+    page_size = clamp_page_size(page_size)
+    generation = _list_generation()
+    if generation is None:
+        return fetch_page(cursor, page_size)
+
+    key = LIST_KEY.format(generation=generation, page_size=page_size, cursor=cursor or '')
+    page = _read(key)
+    if page is not None:
+        return page
+
+    page = fetch_page(cursor, page_size)
+    _write(key, page, settings.USER_LIST_CACHE_TTL)
+    return page
+
+
+def invalidate_users(user_ids=()):
+    """
+    Drop the cached users and every cached list page. Call after a write commits.
+    """
+    try:
+        pipe = get_redis().pipeline(transaction=False)
+        keys = [USER_KEY.format(user_id) for user_id in user_ids]
+        if keys:
+            pipe.delete(*keys)
+        pipe.incr(LIST_GENERATION_KEY)
+        pipe.execute()
+    except RedisError as e:
+        logger.warning(f"User cache invalidation failed: {e}")
+
+
+def cache_stats():
+    try:
+        hits, misses = get_redis().mget(HITS_KEY, MISSES_KEY)
+    except RedisError as e:
+        logger.warning(f"User cache stats read failed: {e}")
+        return {"available": False}
+    hits, misses = int(hits or 0), int(misses or 0)
+    total = hits + misses
+    return {
+        "available": True,
+        "hits": hits,
+        "misses": misses,
+        "hit_ratio": round(hits / total, 4) if total else None,
+    }
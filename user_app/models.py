@@ -18,4 +18,8 @@ class User(models.Model):
         return self.username
     
     class Meta:
-        ordering = ['-date_joined']
\ No newline at end of file
+        ordering = ['-date_joined']
+        indexes = [
+            # Keyset pagination seeks on (date_joined, id), see pagination.py
+            models.Index(fields=['-date_joined', '-id'], name='user_keyset_idx'),
+        ]
\ No newline at end of file
@@ -0,0 +1,122 @@
+"""
+Keyset pagination for users.
+
+Pages are ordered newest first, matching User.Meta.ordering, with the id as a
+tie-breaker so the cursor always points at exactly one row. Seeking from the
+cursor uses the (date_joined, id) index instead of an OFFSET scan.
+"""
+import base64
+from datetime import datetime
+import uuid
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db.models import Q
+from .models import User
+
+USER_FIELDS = ['id', 'username', 'email', 'first_name', 'last_name', 'is_active', 'date_joined']
+KEYSET_ORDERING = ['-date_joined', '-id']
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+class InvalidPageSize(ValueError):
+    pass
+
+
+def encode_cursor(row):
+    raw = f"{row['date_joined'].isoformat()}|{row['id']}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode()).decode()
+        date_joined, user_id = raw.split('|')
+        return datetime.fromisoformat(date_joined), uuid.UUID(user_id)
+    except ValueError as e:
+        raise InvalidCursor(f"Invalid cursor: {cursor}") from e
+
+
+def clamp_page_size(page_size):
+    if not page_size:
+        return settings.USER_LIST_PAGE_SIZE
+    try:
+        page_size = int(page_size)
+    except (TypeError, ValueError) as e:
+        raise InvalidPageSize("page_size must be an integer") from e
+    return max(1, min(page_size, settings.USER_LIST_MAX_PAGE_SIZE))
+
+
+def user_to_dict(row):
+    """
+    Convert a .values() row into the JSON shape returned by the user tasks
+    """
+    return {
+        "id": str(row['id']),
+        "username": row['username'],
+        "email": row['email'],
+        "first_name": row['first_name'],
+        "last_name": row['last_name'],
+        "is_active": row['is_active'],
+        "date_joined": row['date_joined'].isoformat()
+    }
+
+
+def keyset_queryset(cursor=None):
+    queryset = User.objects.order_by(*KEYSET_ORDERING).values(*USER_FIELDS)
+    if cursor:
+        date_joined, user_id = decode_cursor(cursor)
+        queryset = queryset.filter(
+            Q(date_joined__lt=date_joined) | Q(date_joined=date_joined, id__lt=user_id)
+        )
+    return queryset
+
+
+def fetch_page(cursor=None, page_size=None):
+    """
+    Return one page of users and the cursor for the next page (None on the last page)
+    """
+    page_size = clamp_page_size(page_size)
+    # Fetch one extra row to know whether another page exists
+    rows = list(keyset_queryset(cursor)[:page_size + 1])
+    has_more = len(rows) > page_size
+    rows = rows[:page_size]
+
+    return {
+        "users": [user_to_dict(row) for row in rows],
+        "count": len(rows),
+        "next_cursor": encode_cursor(rows[-1]) if has_more and rows else None,
+    }
+
+
+def iter_users(chunk_size=None):
+    """
+    Yield every user without materialising the table in memory. On PostgreSQL
+    iterator() uses a server-side cursor that fetches chunk_size rows at a time.
+    """
+    queryset = keyset_queryset()
+    for row in queryset.iterator(chunk_size=chunk_size or settings.USER_STREAM_CHUNK_SIZE):
+        yield user_to_dict(row)
+
+
+def _keyset_chunk(cursor, chunk_size):
+    return list(keyset_queryset(cursor)[:chunk_size])
+
+
+async def aiter_users(chunk_size=None):
+    """
+    iter_users for ASGI responses, which Django would otherwise read to the
+    end before sending anything. Each chunk is a keyset page fetched in a
+    worker thread, so no database cursor stays open between them.
+    """
+    chunk_size = chunk_size or settings.USER_STREAM_CHUNK_SIZE
+    cursor = None
+    while True:
+        rows = await sync_to_async(_keyset_chunk)(cursor, chunk_size)
+        for row in rows:
+            yield user_to_dict(row)
+        if len(rows) < chunk_size:
+            return
+        cursor = encode_cursor(rows[-1])
@@ -1,3 +1,4 @@
+from django.conf import settings
 from rest_framework import serializers
 from .models import User
 
@@ -5,4 +6,65 @@ class UserSerializer(serializers.ModelSerializer):
     class Meta:
         model = User
         fields = ['id', 'username', 'email', 'first_name', 'last_name', 'is_active', 'date_joined']
-        read_only_fields = ['id', 'date_joined']
\ No newline at end of file
+        read_only_fields = ['id', 'date_joined']
+
+class BulkUserSerializer(UserSerializer):
+    """
+    Row serializer for bulk imports. Uniqueness is checked by the worker
+    once per chunk instead of with two queries per row here.
+    """
+    class Meta(UserSerializer.Meta):
+        extra_kwargs = {
+            'username': {'validators': []},
+            'email': {'validators': []},
+        }
+
+class BulkUserUpdateSerializer(BulkUserSerializer):
+    id = serializers.UUIDField()
+
+    class Meta(BulkUserSerializer.Meta):
+        read_only_fields = ['date_joined']
+
+    def validate(self, attrs):
+        # Rows are validated as partial updates, so 'id' has to be enforced here
+        if 'id' not in attrs:
+            raise serializers.ValidationError({'id': 'This field is required.'})
+        return attrs
+
+class BulkUserOperationSerializer(serializers.Serializer):
+    """
+    Envelope for POST /api/users/bulk/
+    """
+    OPERATIONS = ['CREATE', 'UPDATE', 'DELETE']
+
+    operation = serializers.ChoiceField(choices=OPERATIONS)
+    items = serializers.ListField(allow_empty=False, max_length=settings.USER_BULK_MAX_ITEMS)
+
+    def validate(self, attrs):
+        operation = attrs['operation']
+        items = attrs['items']
+
+        if operation == 'DELETE':
+            rows = serializers.ListField(child=serializers.UUIDField())
+            try:
+                attrs['items'] = [str(user_id) for user_id in rows.run_validation(items)]
+            except serializers.ValidationError as e:
+                raise serializers.ValidationError({'items': e.detail})
+            return attrs
+
+        if operation == 'CREATE':
+            rows = BulkUserSerializer(data=items, many=True)
+        else:
+            rows = BulkUserUpdateSerializer(data=items, many=True, partial=True)
+
+        if not rows.is_valid():
+            raise serializers.ValidationError({'items': rows.errors})
+
+        validated_rows = []
+        for row in rows.validated_data:
+            row = dict(row)
+            if 'id' in row:
+                row['id'] = str(row['id'])
+            validated_rows.append(row)
+        attrs['items'] = validated_rows
+        return attrs
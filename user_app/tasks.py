@@ -1,13 +1,17 @@
-import time
-import random
 from celery import shared_task
 from celery.utils.log import get_task_logger
+from django.conf import settings
+from django.db import IntegrityError, transaction
 from .models import User
-from celery_worker_app.models import Task
+from .cache import cached_page, cached_user, invalidate_users
+from .work import simulate_work
+from celery_worker_app.lifecycle import TrackedTask
 
 logger = get_task_logger(__name__)
 
-@shared_task(bind=True)
+USER_UPDATE_FIELDS = ('username', 'email', 'first_name', 'last_name', 'is_active')
+
+@shared_task(bind=True, base=TrackedTask)
 def create_user(self, user_data):
     """
     Celery task to create a user asynchronously
@@ -15,67 +19,29 @@ def create_user(self, user_data):
     task_id = self.request.id
     logger.info(f"Task {task_id} STARTED: Creating user {user_data['username']}")
     
-    try:
-        # Update task state in database
-        task = Task.objects.get(id=task_id)
-        task.status = "PROCESSING"
-        task.set_progress(0)
-        task.save()
-        
-        # Simulate a time-consuming operation
-        total_steps = 5
-        for step in range(1, total_steps + 1):
-            # Sleep for a random time to simulate processing
-            time.sleep(random.uniform(1.0, 2.0))
-            
-            # Update progress
-            progress = int((step / total_steps) * 100)
-            task.set_progress(progress)
-            
-            # Update Celery task meta
-            self.update_state(
-                state="PROGRESS",
-                meta={"progress": progress}
-            )
-            
-            logger.info(f"Task {task_id} progress: {progress}%")
-        
-        # Create the user
-        user = User.objects.create(
-            username=user_data['username'],
-            email=user_data['email'],
-            first_name=user_data.get('first_name', ''),
-            last_name=user_data.get('last_name', ''),
-            is_active=user_data.get('is_active', True),
-        )
-        
-        # Update task with success result
-        task.status = "DONE"
-        task.result = {
-            "success": True,
-            "user_id": str(user.id),
-            "message": f"Successfully created user {user.username}",
-            "progress": 100
-        }
-        task.save()
-        
-        return task.result
-        
-    except Exception as e:
-        logger.error(f"Task {task_id} FAILED with error: {str(e)}")
-        
-        # Update task with error
-        try:
-            task = Task.objects.get(id=task_id)
-            task.status = "FAILED"
-            task.result = {"error": str(e), "progress": 0}
-            task.save()
-        except Exception as inner_e:
-            logger.error(f"Failed to update task status: {str(inner_e)}")
-            
-        raise
-
-@shared_task(bind=True)
+    # Status transitions are recorded by celery_worker_app.signals and the
+    # Task row is handled by TrackedTask; the task only does its work
+    # Simulate a time-consuming operation (see work.py)
+    simulate_work(self, steps=5, seconds=(1.0, 2.0))
+    
+    # Create the user
+    user = User.objects.create(
+        username=user_data['username'],
+        email=user_data['email'],
+        first_name=user_data.get('first_name', ''),
+        last_name=user_data.get('last_name', ''),
+        is_active=user_data.get('is_active', True),
+    )
+    invalidate_users()
+    
+    return {
+        "success": True,
+        "user_id": str(user.id),
+        "message": f"Successfully created user {user.username}",
+        "progress": 100
+    }
+
+@shared_task(bind=True, base=TrackedTask)
 def update_user(self, user_id, user_data):
     """
     Celery task to update a user asynchronously
@@ -83,82 +49,30 @@ def update_user(self, user_id, user_data):
     task_id = self.request.id
     logger.info(f"Task {task_id} STARTED: Updating user {user_id}")
     
+    # Simulate a time-consuming operation (see work.py)
+    simulate_work(self, steps=4, seconds=(0.5, 1.5))
+    
+    # Get and update the user
     try:
-        # Update task state in database
-        task = Task.objects.get(id=task_id)
-        task.status = "PROCESSING"
-        task.set_progress(0)
-        task.save()
-        
-        # Simulate a time-consuming operation
-        total_steps = 4
-        for step in range(1, total_steps + 1):
-            # Sleep for a random time to simulate processing
-            time.sleep(random.uniform(0.5, 1.5))
-            
-            # Update progress
-            progress = int((step / total_steps) * 100)
-            task.set_progress(progress)
-            
-            # Update Celery task meta
-            self.update_state(
-                state="PROGRESS",
-                meta={"progress": progress}
-            )
-            
-            logger.info(f"Task {task_id} progress: {progress}%")
-        
-        # Get and update the user
-        try:
-            user = User.objects.get(id=user_id)
-            
-            if 'username' in user_data:
-                user.username = user_data['username']
-            if 'email' in user_data:
-                user.email = user_data['email']
-            if 'first_name' in user_data:
-                user.first_name = user_data['first_name']
-            if 'last_name' in user_data:
-                user.last_name = user_data['last_name']
-            if 'is_active' in user_data:
-                user.is_active = user_data['is_active']
-                
-            user.save()
-            
-            # Update task with success result
-            task.status = "DONE"
-            task.result = {
-                "success": True,
-                "user_id": str(user.id),
-                "message": f"Successfully updated user {user.username}",
-                "progress": 100
-            }
-            task.save()
-            
-            return task.result
-            
-        except User.DoesNotExist:
-            error = f"User with ID {user_id} does not exist"
-            task.status = "FAILED"
-            task.result = {"error": error, "progress": 0}
-            task.save()
-            raise Exception(error)
-        
-    except Exception as e:
-        logger.error(f"Task {task_id} FAILED with error: {str(e)}")
-        
-        # Update task with error
-        try:
-            task = Task.objects.get(id=task_id)
-            task.status = "FAILED"
-            task.result = {"error": str(e), "progress": 0}
-            task.save()
-        except Exception as inner_e:
-            logger.error(f"Failed to update task status: {str(inner_e)}")
-            
-        raise
-
-@shared_task(bind=True)
+        user = User.objects.get(id=user_id)
+    except User.DoesNotExist:
+        raise Exception(f"User with ID {user_id} does not exist")
+    
+    # Write only the fields the request changed
+    fields = [field for field in USER_UPDATE_FIELDS if field in user_data]
+    for field in fields:
+        setattr(user, field, user_data[field])
+    user.save(update_fields=fields)
+    invalidate_users([user_id])
+    
+    return {
+        "success": True,
+        "user_id": str(user.id),
+        "message": f"Successfully updated user {user.username}",
+        "progress": 100
+    }
+
+@shared_task(bind=True, base=TrackedTask)
 def delete_user(self, user_id):
     """
     Celery task to delete a user asynchronously
@@ -166,70 +80,26 @@ def delete_user(self, user_id):
     task_id = self.request.id
     logger.info(f"Task {task_id} STARTED: Deleting user {user_id}")
     
+    # Simulate a time-consuming operation (see work.py)
+    simulate_work(self, steps=3, seconds=(0.5, 1.0))
+    
+    # Get and delete the user
     try:
-        # Update task state in database
-        task = Task.objects.get(id=task_id)
-        task.status = "PROCESSING"
-        task.set_progress(0)
-        task.save()
-        
-        # Simulate a time-consuming operation
-        total_steps = 3
-        for step in range(1, total_steps + 1):
-            # Sleep for a random time to simulate processing
-            time.sleep(random.uniform(0.5, 1.0))
-            
-            # Update progress
-            progress = int((step / total_steps) * 100)
-            task.set_progress(progress)
-            
-            # Update Celery task meta
-            self.update_state(
-                state="PROGRESS",
-                meta={"progress": progress}
-            )
-            
-            logger.info(f"Task {task_id} progress: {progress}%")
-        
-        # Get and delete the user
-        try:
-            user = User.objects.get(id=user_id)
-            username = user.username
-            user.delete()
-            
-            # Update task with success result
-            task.status = "DONE"
-            task.result = {
-                "success": True,
-                "message": f"Successfully deleted user {username}",
-                "progress": 100
-            }
-            task.save()
-            
-            return task.result
-            
-        except User.DoesNotExist:
-            error = f"User with ID {user_id} does not exist"
-            task.status = "FAILED"
-            task.result = {"error": error, "progress": 0}
-            task.save()
-            raise Exception(error)
-        
-    except Exception as e:
-        logger.error(f"Task {task_id} FAILED with error: {str(e)}")
-        
-        # Update task with error
-        try:
-            task = Task.objects.get(id=task_id)
-            task.status = "FAILED"
-            task.result = {"error": str(e), "progress": 0}
-            task.save()
-        except Exception as inner_e:
-            logger.error(f"Failed to update task status: {str(inner_e)}")
-            
-        raise
-
-@shared_task(bind=True)
+        user = User.objects.get(id=user_id)
+    except User.DoesNotExist:
+        raise Exception(f"User with ID {user_id} does not exist")
+    
+    username = user.username
+    user.delete()
+    invalidate_users([user_id])
+    
+    return {
+        "success": True,
+        "message": f"Successfully deleted user {username}",
+        "progress": 100
+    }
+
+@shared_task(bind=True, base=TrackedTask, single_flight=True)
 def get_user(self, user_id):
     """
     Celery task to get a user asynchronously
@@ -237,119 +107,248 @@ def get_user(self, user_id):
     task_id = self.request.id
     logger.info(f"Task {task_id} STARTED: Getting user {user_id}")
     
-    try:
-        # Update task state in database
-        task = Task.objects.get(id=task_id)
-        task.status = "PROCESSING"
-        task.set_progress(0)
-        task.save()
-        
-        # Simulate a time-consuming operation (just for demonstration)
-        time.sleep(random.uniform(0.5, 1.5))
-        task.set_progress(50)
-        
-        # Get the user
-        try:
-            user = User.objects.get(id=user_id)
-            
-            # Update task with success result
-            user_data = {
-                "id": str(user.id),
-                "username": user.username,
-                "email": user.email,
-                "first_name": user.first_name,
-                "last_name": user.last_name,
-                "is_active": user.is_active,
-                "date_joined": user.date_joined.isoformat()
-            }
-            
-            task.status = "DONE"
-            task.result = {
-                "success": True,
-                "user": user_data,
-                "progress": 100
-            }
-            task.save()
-            
-            return task.result
-            
-        except User.DoesNotExist:
-            error = f"User with ID {user_id} does not exist"
-            task.status = "FAILED"
-            task.result = {"error": error, "progress": 0}
-            task.save()
-            raise Exception(error)
-        
-    except Exception as e:
-        logger.error(f"Task {task_id} FAILED with error: {str(e)}")
-        
-        # Update task with error
-        try:
-            task = Task.objects.get(id=task_id)
-            task.status = "FAILED"
-            task.result = {"error": str(e), "progress": 0}
-            task.save()
-        except Exception as inner_e:
-            logger.error(f"Failed to update task status: {str(inner_e)}")
-            
-        raise
-
-@shared_task(bind=True)
-def list_users(self):
+    # Simulate a time-consuming operation (just for demonstration)
+    simulate_work(self, steps=1, seconds=(0.5, 1.5), final_progress=50)
+    
+    # Get the user, from the cache when possible
+    user_data = cached_user(user_id)
+    if user_data is None:
+        raise Exception(f"User with ID {user_id} does not exist")
+    
+    return {
+        "success": True,
+        "user": user_data,
+        "progress": 100
+    }
+
+@shared_task(bind=True, base=TrackedTask, single_flight=True)
+def list_users(self, cursor=None, page_size=None):
     """
-    Celery task to list all users asynchronously
+    Celery task to list one keyset page of users asynchronously
     """
     task_id = self.request.id
-    logger.info(f"Task {task_id} STARTED: Listing all users")
+    logger.info(f"Task {task_id} STARTED: Listing users after cursor {cursor}")
+    
+    # Simulate a time-consuming operation
+    simulate_work(self, steps=1, seconds=(1.0, 2.0), final_progress=50)
+    
+    # Get a single page of users; clients follow next_cursor for the rest
+    page = cached_page(cursor, page_size)
     
+    return {
+        "success": True,
+        **page,
+        "progress": 100
+    }
+
+def _chunks(items, size):
+    """
+    Yield (offset, chunk) pairs so per-row outcomes keep their request index
+    """
+    for offset in range(0, len(items), size):
+        yield offset, items[offset:offset + size]
+
+def _bulk_progress(outcomes, chunks_done, chunks_total):
+    succeeded = sum(1 for outcome in outcomes if outcome["success"])
+    return {
+        "progress": int((chunks_done / chunks_total) * 100) if chunks_total else 100,
+        "chunks_done": chunks_done,
+        "chunks_total": chunks_total,
+        "processed": len(outcomes),
+        "succeeded": succeeded,
+        "failed": len(outcomes) - succeeded,
+    }
+
+def _run_bulk(task_self, items, process_chunk, action):
+    """
+    Shared driver for the bulk tasks: one Task row, one progress write per chunk
+    """
+    task_id = task_self.request.id
+    logger.info(f"Task {task_id} STARTED: Bulk {action} of {len(items)} users")
+
+    chunk_size = settings.USER_BULK_CHUNK_SIZE
+    chunks_total = (len(items) + chunk_size - 1) // chunk_size
+
+    outcomes = []
+    for chunk_number, (offset, chunk) in enumerate(_chunks(items, chunk_size), start=1):
+        chunk_outcomes = process_chunk(offset, chunk)
+        outcomes.extend(chunk_outcomes)
+
+        # Drop cached copies of the users this chunk changed
+        invalidate_users([outcome["user_id"] for outcome in chunk_outcomes if outcome["success"]])
+
+        # Report progress once per chunk rather than once per row
+        task_self.progress(**_bulk_progress(outcomes, chunk_number, chunks_total))
+
+        logger.info(f"Task {task_id} progress: chunk {chunk_number}/{chunks_total}")
+
+    summary = _bulk_progress(outcomes, chunks_total, chunks_total)
+    return {
+        "success": True,
+        "message": f"Bulk {action} processed {summary['processed']} users: "
+                   f"{summary['succeeded']} succeeded, {summary['failed']} failed",
+        **summary,
+        "progress": 100,
+        "results": outcomes,
+    }
+
+def _unique_conflicts(rows, exclude_ids=()):
+    """
+    Return the usernames and emails in rows that already belong to other users
+    """
+    usernames = [row['username'] for row in rows if 'username' in row]
+    emails = [row['email'] for row in rows if 'email' in row]
+    existing = User.objects.exclude(id__in=exclude_ids)
+    taken_usernames = set(existing.filter(username__in=usernames).values_list('username', flat=True))
+    taken_emails = set(existing.filter(email__in=emails).values_list('email', flat=True))
+    return taken_usernames, taken_emails
+
+def _check_unique(row, taken_usernames, taken_emails, seen_usernames, seen_emails):
+    """
+    Return an error message if row clashes with the database or an earlier row in the batch
+    """
+    username = row.get('username')
+    email = row.get('email')
+    if username is not None and (username in taken_usernames or username in seen_usernames):
+        return f"User with username {username} already exists"
+    if email is not None and (email in taken_emails or email in seen_emails):
+        return f"User with email {email} already exists"
+    if username is not None:
+        seen_usernames.add(username)
+    if email is not None:
+        seen_emails.add(email)
+    return None
+
+def _bulk_create_chunk(offset, chunk):
+    taken_usernames, taken_emails = _unique_conflicts(chunk)
+    seen_usernames, seen_emails = set(), set()
+    outcomes = []
+    pending = []
+
+    for index, row in enumerate(chunk, start=offset):
+        error = _check_unique(row, taken_usernames, taken_emails, seen_usernames, seen_emails)
+        if error:
+            outcomes.append({"index": index, "success": False, "error": error})
+            continue
+        pending.append((index, User(
+            username=row['username'],
+            email=row['email'],
+            first_name=row.get('first_name', ''),
+            last_name=row.get('last_name', ''),
+            is_active=row.get('is_active', True),
+        )))
+
     try:
-        # Update task state in database
-        task = Task.objects.get(id=task_id)
-        task.status = "PROCESSING"
-        task.set_progress(0)
-        task.save()
-        
-        # Simulate a time-consuming operation
-        time.sleep(random.uniform(1.0, 2.0))
-        task.set_progress(50)
-        
-        # Get all users
-        users = User.objects.all()
-        user_list = []
-        
-        for user in users:
-            user_list.append({
-                "id": str(user.id),
-                "username": user.username,
-                "email": user.email,
-                "first_name": user.first_name,
-                "last_name": user.last_name,
-                "is_active": user.is_active,
-                "date_joined": user.date_joined.isoformat()
-            })
-        
-        # Update task with success result
-        task.status = "DONE"
-        task.result = {
-            "success": True,
-            "users": user_list,
-            "count": len(user_list),
-            "progress": 100
-        }
-        task.save()
-        
-        return task.result
-        
-    except Exception as e:
-        logger.error(f"Task {task_id} FAILED with error: {str(e)}")
-        
-        # Update task with error
-        try:
-            task = Task.objects.get(id=task_id)
-            task.status = "FAILED"
-            task.result = {"error": str(e), "progress": 0}
-            task.save()
-        except Exception as inner_e:
-            logger.error(f"Failed to update task status: {str(inner_e)}")
-            
-        raise
\ No newline at end of file
+        with transaction.atomic():
+            User.objects.bulk_create([user for _, user in pending])
+        outcomes.extend(
+            {"index": index, "success": True, "user_id": str(user.id)}
+            for index, user in pending
+        )
+    except IntegrityError:
+        # A concurrent writer claimed a username or email after the pre-check,
+        # so fall back to row-by-row inserts to find out which rows clash
+        for index, user in pending:
+            try:
+                with transaction.atomic():
+                    user.save(force_insert=True)
+                outcomes.append({"index": index, "success": True, "user_id": str(user.id)})
+            except IntegrityError as e:
+                outcomes.append({"index": index, "success": False, "error": str(e)})
+
+    return sorted(outcomes, key=lambda outcome: outcome["index"])
+
+def _bulk_update_chunk(offset, chunk):
+    user_ids = [row['id'] for row in chunk]
+    users = {str(pk): user for pk, user in User.objects.in_bulk(user_ids).items()}
+    taken_usernames, taken_emails = _unique_conflicts(chunk, exclude_ids=user_ids)
+    seen_usernames, seen_emails, seen_ids = set(), set(), set()
+    outcomes = []
+    pending = []
+    fields = set()
+
+    for index, row in enumerate(chunk, start=offset):
+        user_id = row['id']
+        user = users.get(user_id)
+        if user is None:
+            outcomes.append({"index": index, "success": False,
+                             "error": f"User with ID {user_id} does not exist"})
+            continue
+        if user_id in seen_ids:
+            outcomes.append({"index": index, "success": False,
+                             "error": f"User with ID {user_id} appears more than once in the batch"})
+            continue
+        seen_ids.add(user_id)
+
+        error = _check_unique(row, taken_usernames, taken_emails, seen_usernames, seen_emails)
+        if error:
+            outcomes.append({"index": index, "success": False, "error": error})
+            continue
+
+        row_fields = [field for field in row if field != 'id']
+        for field in row_fields:
+            setattr(user, field, row[field])
+        fields.update(row_fields)
+        pending.append((index, user, row_fields))
+
+    try:
+        if fields:
+            with transaction.atomic():
+                User.objects.bulk_update([user for _, user, _ in pending], sorted(fields))
+        outcomes.extend(
+            {"index": index, "success": True, "user_id": str(user.id)}
+            for index, user, _ in pending
+        )
+    except IntegrityError:
+        # Rows swapping usernames or emails within the batch, or a concurrent
+        # writer, can still violate a unique constraint; retry row by row
+        for index, user, row_fields in pending:
+            try:
+                with transaction.atomic():
+                    user.save(update_fields=row_fields)
+                outcomes.append({"index": index, "success": True, "user_id": str(user.id)})
+            except IntegrityError as e:
+                outcomes.append({"index": index, "success": False, "error": str(e)})
+
+    return sorted(outcomes, key=lambda outcome: outcome["index"])
+
+def _bulk_delete_chunk(offset, chunk):
+    existing = {
+        str(pk) for pk in User.objects.filter(id__in=chunk).values_list('id', flat=True)
+    }
+    User.objects.filter(id__in=existing).delete()
+
+    outcomes = []
+    seen_ids = set()
+    for index, user_id in enumerate(chunk, start=offset):
+        if user_id in seen_ids:
+            outcomes.append({"index": index, "success": False,
+                             "error": f"User with ID {user_id} appears more than once in the batch"})
+        elif user_id in existing:
+            outcomes.append({"index": index, "success": True, "user_id": user_id})
+        else:
+            outcomes.append({"index": index, "success": False,
+                             "error": f"User with ID {user_id} does not exist"})
+        seen_ids.add(user_id)
+    return outcomes
+
+@shared_task(bind=True, base=TrackedTask)
+def bulk_create_users(self, users_data):
+    """
+    Celery task to create many users with chunked bulk inserts
+    """
+    return _run_bulk(self, users_data, _bulk_create_chunk, "create")
+
+@shared_task(bind=True, base=TrackedTask)
+def bulk_update_users(self, users_data):
+    """
+    Celery task to update many users with chunked bulk updates
+    """
+    return _run_bulk(self, users_data, _bulk_update_chunk, "update")
+
+@shared_task(bind=True, base=TrackedTask)
+def bulk_delete_users(self, user_ids):
+    """
+    Celery task to delete many users with chunked filtered deletes
+    """
+    return _run_bulk(self, user_ids, _bulk_delete_chunk, "delete")
@@ -1,3 +1,237 @@
-from django.test import TestCase
+import uuid
+from datetime import datetime, timezone as dt_timezone
+from unittest import mock, skipUnless
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.test import TestCase, override_settings
+from rest_framework import status
+from rest_framework.test import APITestCase
+from celery_worker_app.admission import Overloaded
+from celery_worker_app.idempotency import idempotency_key_for
+from celery_worker_app.models import Task
+from celery_worker_app.redis_client import get_redis
+from celery_worker_app.tests import redis_available
+from .models import User
+from .pagination import aiter_users, decode_cursor, encode_cursor, fetch_page, iter_users
+from .tasks import _bulk_create_chunk, _bulk_delete_chunk, _bulk_update_chunk, bulk_create_users, create_user
 
-# Create your tests here.
+
+def make_user(username):
+    return User.objects.create(username=username, email=f"{username}@example.com")
+
+
+def row(username, **fields):
+    return {"username": username, "email": f"{username}@example.com", **fields}
+
+
+def errors(outcomes):
+    return {outcome["index"]: outcome["error"] for outcome in outcomes if not outcome["success"]}
+
+
+@skipUnless(redis_available(), "Idempotency-Key replay needs Redis")
+class IdempotencyKeyTests(APITestCase):
+    def setUp(self):
+        self.key = str(uuid.uuid4())
+        # The test client's requests come from 127.0.0.1 (see fairness.client_id)
+        self.addCleanup(get_redis().delete, idempotency_key_for(create_user.name, "ip:127.0.0.1", self.key))
+
+    def create(self, username):
+        return self.client.post(
+            '/api/users/',
+            {"username": username, "email": f"{username}@example.com"},
+            format='json',
+            HTTP_IDEMPOTENCY_KEY=self.key,
+        )
+
+    def test_retry_with_the_same_key_replays_the_task(self):
+        first = self.create("alice")
+        second = self.create("alice")
+
+        self.assertEqual(first.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(second.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(second.data["task_id"], first.data["task_id"])
+        self.assertEqual(second["Idempotent-Replayed"], "true")
+        self.assertEqual(Task.objects.filter(task_name='create_user').count(), 1)
+
+    def test_same_key_with_a_different_body_is_refused(self):
+        self.create("alice")
+        response = self.create("bob")
+
+        self.assertEqual(response.status_code, status.HTTP_422_UNPROCESSABLE_ENTITY)
+        self.assertEqual(Task.objects.filter(task_name='create_user').count(), 1)
+
+
+class BulkOutcomeTests(TestCase):
+    def test_create_reports_duplicates_within_the_batch_and_in_the_database(self):
+        make_user("taken")
+        outcomes = _bulk_create_chunk(10, [
+            row("alice"),
+            row("alice", email="other@example.com"),
+            row("bob", email="alice@example.com"),
+            row("taken", email="new@example.com"),
+            row("carol"),
+        ])
+
+        self.assertEqual([outcome["index"] for outcome in outcomes], [10, 11, 12, 13, 14])
+        self.assertEqual(errors(outcomes), {
+            11: "User with username alice already exists",
+            12: "User with email alice@example.com already exists",
+            13: "User with username taken already exists",
+        })
+        self.assertEqual(
+            sorted(User.objects.values_list('username', flat=True)), ["alice", "carol", "taken"]
+        )
+
+    def test_create_falls_back_to_row_by_row_inserts(self):
+        # A concurrent writer takes a username after the pre-check
+        make_user("racer")
+        with mock.patch('user_app.tasks._unique_conflicts', return_value=(set(), set())):
+            outcomes = _bulk_create_chunk(0, [row("alice"), row("racer"), row("bob")])
+
+        self.assertEqual([outcome["success"] for outcome in outcomes], [True, False, True])
+        self.assertEqual(User.objects.filter(username__in=["alice", "bob"]).count(), 2)
+
+    def test_update_reports_missing_and_repeated_ids_and_clashes(self):
+        alice, bob = make_user("alice"), make_user("bob")
+        make_user("carol")
+        missing = str(uuid.uuid4())
+        outcomes = _bulk_update_chunk(0, [
+            {"id": str(alice.id), "first_name": "Alice"},
+            {"id": missing, "first_name": "Nobody"},
+            {"id": str(alice.id), "first_name": "Again"},
+            {"id": str(bob.id), "username": "carol"},
+        ])
+
+        self.assertEqual(errors(outcomes), {
+            1: f"User with ID {missing} does not exist",
+            2: f"User with ID {alice.id} appears more than once in the batch",
+            3: "User with username carol already exists",
+        })
+        alice.refresh_from_db()
+        self.assertEqual(alice.first_name, "Alice")
+
+    def test_update_falls_back_to_row_by_row_saves(self):
+        # Swapping usernames passes the pre-check but breaks the unique index
+        alice, bob = make_user("alice"), make_user("bob")
+        outcomes = _bulk_update_chunk(0, [
+            {"id": str(alice.id), "username": "bob"},
+            {"id": str(bob.id), "username": "alice"},
+        ])
+
+        self.assertEqual([outcome["success"] for outcome in outcomes], [False, False])
+        self.assertEqual(sorted(User.objects.values_list('username', flat=True)), ["alice", "bob"])
+
+    def test_delete_reports_missing_and_repeated_ids(self):
+        alice = make_user("alice")
+        missing = str(uuid.uuid4())
+        outcomes = _bulk_delete_chunk(0, [str(alice.id), missing, str(alice.id)])
+
+        self.assertEqual(outcomes[0], {"index": 0, "success": True, "user_id": str(alice.id)})
+        self.assertEqual(errors(outcomes), {
+            1: f"User with ID {missing} does not exist",
+            2: f"User with ID {alice.id} appears more than once in the batch",
+        })
+        self.assertFalse(User.objects.exists())
+
+    @override_settings(USER_BULK_CHUNK_SIZE=2)
+    def test_duplicates_across_chunks_are_caught_against_the_database(self):
+        task = Task.objects.create(id=str(uuid.uuid4()), task_name=bulk_create_users.__name__)
+        result = bulk_create_users.apply(
+            args=[[row("alice"), row("bob"), row("alice"), row("carol")]], task_id=task.id
+        ).get()
+
+        self.assertEqual((result["succeeded"], result["failed"], result["chunks_total"]), (3, 1, 2))
+        self.assertEqual(errors(result["results"]), {2: "User with username alice already exists"})
+
+
+def backlog(writes=0, pending=0):
+    return {"queues": {"writes": writes, "reads": 0}, "active": {}, "pending": pending}
+
+
+@override_settings(
+    TASK_ADMISSION_QUEUE_SOFT_LIMIT=10,
+    TASK_ADMISSION_QUEUE_HARD_LIMIT=100,
+    TASK_ADMISSION_PENDING_LIMIT=1000,
+)
+class AdmissionTests(APITestCase):
+    def delete(self, writes=0, pending=0, throttled=False):
+        with mock.patch('celery_worker_app.admission.snapshot', return_value=backlog(writes, pending)), \
+                mock.patch('celery_worker_app.dispatch.take_token', return_value=not throttled):
+            return self.client.delete(f'/api/users/{uuid.uuid4()}/')
+
+    def assertRefused(self, response, status_code):
+        self.assertEqual(response.status_code, status_code)
+        self.assertEqual(response["Retry-After"], str(settings.TASK_ADMISSION_RETRY_AFTER))
+        self.assertFalse(Task.objects.exists())
+
+    def test_full_queue_is_refused_with_503(self):
+        self.assertRefused(self.delete(writes=100), status.HTTP_503_SERVICE_UNAVAILABLE)
+
+    def test_too_many_pending_tasks_are_refused_with_503(self):
+        self.assertRefused(self.delete(pending=1000), status.HTTP_503_SERVICE_UNAVAILABLE)
+
+    def test_throttled_client_on_a_busy_queue_is_refused_with_429(self):
+        self.assertRefused(self.delete(writes=10, throttled=True), status.HTTP_429_TOO_MANY_REQUESTS)
+
+    def test_client_within_its_rate_is_admitted_to_a_busy_queue(self):
+        response = self.delete(writes=10)
+
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertIsNone(Task.objects.get(id=response.data["task_id"]).dispatch_payload["priority"])
+
+    def test_throttled_client_is_demoted_not_refused(self):
+        response = self.delete(throttled=True)
+
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        payload = Task.objects.get(id=response.data["task_id"]).dispatch_payload
+        self.assertEqual(payload["priority"], settings.TASK_THROTTLED_PRIORITY)
+
+    def test_refused_read_is_answered_inline(self):
+        user = make_user("alice")
+        with mock.patch('celery_worker_app.dispatch.admit',
+                        side_effect=Overloaded(settings.TASK_ADMISSION_RETRY_AFTER)):
+            response = self.client.get(f'/api/users/{user.id}/?sync=0')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["username"], "alice")
+        self.assertFalse(Task.objects.exists())
+
+
+class PaginationTests(APITestCase):
+    def test_cursor_round_trip(self):
+        row = {"date_joined": datetime(2024, 5, 1, 12, 30, 15, 123456, tzinfo=dt_timezone.utc), "id": uuid.uuid4()}
+
+        self.assertEqual(decode_cursor(encode_cursor(row)), (row["date_joined"], row["id"]))
+
+    def test_pages_are_stable_across_equal_timestamps(self):
+        for number in range(5):
+            make_user(f"user{number}")
+        User.objects.update(date_joined=datetime(2024, 5, 1, tzinfo=dt_timezone.utc))
+        expected = sorted((str(pk) for pk in User.objects.values_list('id', flat=True)), reverse=True)
+
+        seen, cursor = [], None
+        while True:
+            page = fetch_page(cursor, 2)
+            seen.extend(user["id"] for user in page["users"])
+            cursor = page["next_cursor"]
+            if cursor is None:
+                break
+
+        self.assertEqual(seen, expected)
+        self.assertEqual([user["id"] for user in iter_users()], expected)
+
+        async def streamed():
+            return [user["id"] async for user in aiter_users(chunk_size=2)]
+        self.assertEqual(async_to_sync(streamed)(), expected)
+
+    def test_malformed_cursor_is_a_400(self):
+        response = self.client.get('/api/users/', {"cursor": "not-a-cursor", "sync": "1"})
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data["detail"], "Invalid cursor: not-a-cursor")
+
+    def test_malformed_page_size_is_a_400(self):
+        response = self.client.get('/api/users/', {"page_size": "ten", "sync": "1"})
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data["detail"], "page_size must be an integer")
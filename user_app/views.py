@@ -1,119 +1,206 @@
+import json
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.handlers.asgi import ASGIRequest
+from django.http import StreamingHttpResponse
 from rest_framework import viewsets, status
+from rest_framework.decorators import action
 from rest_framework.response import Response
-from .serializers import UserSerializer
-from .tasks import create_user, update_user, delete_user, get_user, list_users
-from celery_worker_app.models import Task
+from .cache import cache_stats, cached_page, cached_user
+from .pagination import aiter_users, clamp_page_size, decode_cursor, iter_users
+from .serializers import UserSerializer, BulkUserOperationSerializer
+from .tasks import (
+    create_user, update_user, delete_user, get_user, list_users,
+    bulk_create_users, bulk_update_users, bulk_delete_users,
+)
+from celery_worker_app.admission import Overloaded, queue_backlogged
+from celery_worker_app.conditional import conditional_response
+from celery_worker_app.dispatch import enqueue, replay
+from celery_worker_app.fairness import client_id
+from celery_worker_app.idempotency import request_fingerprint
+
+def wants_sync(request, read_task):
+    """
+    Reads are answered inline when asked for with ?sync=1 or 'Prefer: respond-sync',
+    when USER_READS_SYNC is on, or while read_task's queue holds at least
+    USER_READS_SYNC_QUEUE_DEPTH messages. ?sync=0 or 'Prefer: respond-async'
+    forces a task.
+    """
+    sync = request.query_params.get('sync')
+    if sync is not None:
+        return sync.lower() in ('1', 'true', 'yes')
+    
+    preferences = [p.strip().lower() for p in request.headers.get('Prefer', '').split(',')]
+    if 'respond-sync' in preferences:
+        return True
+    if 'respond-async' in preferences:
+        return False
+    return settings.USER_READS_SYNC or queue_backlogged(read_task.name, settings.USER_READS_SYNC_QUEUE_DEPTH)
+
+def task_accepted(task, message):
+    """
+    202 response pointing at the task doing the work. A repeated request is
+    answered with the task already queued for it, flagged with an
+    Idempotent-Replayed header.
+    """
+    response = Response({
+        "task_id": task.id,
+        "message": message,
+        "status_endpoint": f"/api/tasks/{task.id}/status/"
+    }, status=status.HTTP_202_ACCEPTED)
+    if task.replayed:
+        response["Idempotent-Replayed"] = "true"
+    return response
 
 class UserViewSet(viewsets.ViewSet):
     """
     A viewset that provides CRUD operations for users through Celery tasks
     """
     
+    def _idempotency(self, request):
+        """
+        The request's Idempotency-Key and a digest of what it asks for, or
+        (None, None). The body is only hashed when there is a key, and once.
+        """
+        key = request.headers.get("Idempotency-Key")
+        if not key:
+            return None, None
+        if not hasattr(request, 'idempotency_digest'):
+            request.idempotency_digest = request_fingerprint(request)
+        return key, request.idempotency_digest
+    
+    def _enqueue(self, request, celery_task, args, **fields):
+        """
+        Record a Task for celery_task on behalf of the requesting client; it is
+        published once the record has committed
+        """
+        key, digest = self._idempotency(request)
+        return enqueue(
+            celery_task, args,
+            idempotency_key=key,
+            request_digest=digest,
+            client_id=client_id(request),
+            **fields
+        )
+    
+    def _replay(self, request, celery_task):
+        """
+        202 for the task an earlier request with the same Idempotency-Key
+        started, or None. Checked before validation, which a retry of a
+        finished create or update would no longer pass.
+        """
+        key, digest = self._idempotency(request)
+        if not key:
+            return None
+        task = replay(celery_task, key, client_id=client_id(request), request_digest=digest)
+        return task_accepted(task, "Task already created for this request") if task else None
+    
+    def _user_response(self, request, pk):
+        """
+        The user read straight from the cache or database (a sync read)
+        """
+        try:
+            user_data = cached_user(pk)
+        except ValidationError:
+            user_data = None
+        if user_data is None:
+            return Response(
+                {"detail": f"User with ID {pk} does not exist"},
+                status=status.HTTP_404_NOT_FOUND
+            )
+        return conditional_response(request, user_data)
+    
     def list(self, request):
         """
-        List all users by creating a Celery task
+        List one page of users by creating a Celery task, or directly with sync reads
         """
-        # Create a Celery task
-        task_result = list_users.delay()
+        cursor = request.query_params.get('cursor')
+        try:
+            page_size = clamp_page_size(request.query_params.get('page_size'))
+            if cursor:
+                decode_cursor(cursor)
+        except ValueError as e:
+            return Response({"detail": str(e)}, status=status.HTTP_400_BAD_REQUEST)
         
-        # Create a task record in the database
-        task = Task.objects.create(
-            id=task_result.id,
-            status="PENDING",
-            task_name="list_users",
-            related_table="user",
-            operation="READ",
-            input_data={},
-            result={"progress": 0}
-        )
+        if wants_sync(request, list_users):
+            return conditional_response(request, cached_page(cursor, page_size))
+        
+        try:
+            task = self._enqueue(
+                request, list_users, [cursor, page_size],
+                related_table="user",
+                operation="READ",
+                input_data={"cursor": cursor, "page_size": page_size}
+            )
+        except Overloaded:
+            # Too much is queued to take the task; reads can still be answered inline
+            return conditional_response(request, cached_page(cursor, page_size))
         
-        return Response({
-            "task_id": task.id,
-            "message": "Task created to list all users",
-            "status_endpoint": f"/api/tasks/{task.id}/status/"
-        }, status=status.HTTP_202_ACCEPTED)
+        return task_accepted(task, "Task created to list users")
     
     def retrieve(self, request, pk=None):
         """
-        Retrieve a user by creating a Celery task
+        Retrieve a user by creating a Celery task, or directly with sync reads
         """
-        # Create a Celery task
-        task_result = get_user.delay(pk)
+        if wants_sync(request, get_user):
+            return self._user_response(request, pk)
         
-        # Create a task record in the database
-        task = Task.objects.create(
-            id=task_result.id,
-            status="PENDING",
-            task_name="get_user",
-            related_table="user",
-            related_id=pk,
-            operation="READ",
-            input_data={"user_id": pk},
-            result={"progress": 0}
-        )
+        try:
+            task = self._enqueue(
+                request, get_user, [pk],
+                related_table="user",
+                related_id=pk,
+                operation="READ",
+                input_data={"user_id": pk}
+            )
+        except Overloaded:
+            # Too much is queued to take the task; reads can still be answered inline
+            return self._user_response(request, pk)
         
-        return Response({
-            "task_id": task.id,
-            "message": f"Task created to retrieve user {pk}",
-            "status_endpoint": f"/api/tasks/{task.id}/status/"
-        }, status=status.HTTP_202_ACCEPTED)
+        return task_accepted(task, f"Task created to retrieve user {pk}")
     
     def create(self, request):
         """
         Create a user by creating a Celery task
         """
+        replayed = self._replay(request, create_user)
+        if replayed:
+            return replayed
+        
         serializer = UserSerializer(data=request.data)
         if not serializer.is_valid():
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
         
-        # Create a Celery task
-        task_result = create_user.delay(serializer.validated_data)
-        
-        # Create a task record in the database
-        task = Task.objects.create(
-            id=task_result.id,
-            status="PENDING",
-            task_name="create_user",
+        task = self._enqueue(
+            request, create_user, [serializer.validated_data],
             related_table="user",
             operation="CREATE",
-            input_data=serializer.validated_data,
-            result={"progress": 0}
+            input_data=serializer.validated_data
         )
         
-        return Response({
-            "task_id": task.id,
-            "message": f"Task created to create user {serializer.validated_data['username']}",
-            "status_endpoint": f"/api/tasks/{task.id}/status/"
-        }, status=status.HTTP_202_ACCEPTED)
+        return task_accepted(task, f"Task created to create user {serializer.validated_data['username']}")
     
     def update(self, request, pk=None):
         """
         Update a user by creating a Celery task
         """
+        replayed = self._replay(request, update_user)
+        if replayed:
+            return replayed
+        
         serializer = UserSerializer(data=request.data, partial=True)
         if not serializer.is_valid():
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
         
-        # Create a Celery task
-        task_result = update_user.delay(pk, serializer.validated_data)
-        
-        # Create a task record in the database
-        task = Task.objects.create(
-            id=task_result.id,
-            status="PENDING",
-            task_name="update_user",
+        task = self._enqueue(
+            request, update_user, [pk, serializer.validated_data],
             related_table="user",
             related_id=pk,
             operation="UPDATE",
-            input_data={"user_id": pk, "data": serializer.validated_data},
-            result={"progress": 0}
+            input_data={"user_id": pk, "data": serializer.validated_data}
         )
         
-        return Response({
-            "task_id": task.id,
-            "message": f"Task created to update user {pk}",
-            "status_endpoint": f"/api/tasks/{task.id}/status/"
-        }, status=status.HTTP_202_ACCEPTED)
+        return task_accepted(task, f"Task created to update user {pk}")
     
     def partial_update(self, request, pk=None):
         """
@@ -126,23 +213,56 @@ class UserViewSet(viewsets.ViewSet):
         """
         Delete a user by creating a Celery task
         """
-        # Create a Celery task
-        task_result = delete_user.delay(pk)
-        
-        # Create a task record in the database
-        task = Task.objects.create(
-            id=task_result.id,
-            status="PENDING",
-            task_name="delete_user",
+        task = self._enqueue(
+            request, delete_user, [pk],
             related_table="user",
             related_id=pk,
             operation="DELETE",
-            input_data={"user_id": pk},
-            result={"progress": 0}
+            input_data={"user_id": pk}
+        )
+        
+        return task_accepted(task, f"Task created to delete user {pk}")
+    
+    @action(detail=False, methods=['get'])
+    def stream(self, request):
+        """
+        Stream every user as newline-delimited JSON straight from the database
+        """
+        if isinstance(request._request, ASGIRequest):
+            rows = (json.dumps(user) + "\n" async for user in aiter_users())
+        else:
+            rows = (json.dumps(user) + "\n" for user in iter_users())
+        return StreamingHttpResponse(rows, content_type="application/x-ndjson")
+    
+    @action(detail=False, methods=['get'], url_path='cache-stats')
+    def cache_stats(self, request):
+        """
+        Hit/miss counters for the user read cache
+        """
+        return Response(cache_stats())
+    
+    @action(detail=False, methods=['post'])
+    def bulk(self, request):
+        """
+        Create, update or delete many users with a single batched Celery task
+        """
+        serializer = BulkUserOperationSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        
+        operation = serializer.validated_data['operation']
+        items = serializer.validated_data['items']
+        bulk_task = {
+            "CREATE": bulk_create_users,
+            "UPDATE": bulk_update_users,
+            "DELETE": bulk_delete_users,
+        }[operation]
+        
+        task = self._enqueue(
+            request, bulk_task, [items],
+            related_table="user",
+            operation=operation,
+            input_data={"count": len(items)}
         )
         
-        return Response({
-            "task_id": task.id,
-            "message": f"Task created to delete user {pk}",
-            "status_endpoint": f"/api/tasks/{task.id}/status/"
-        }, status=status.HTTP_202_ACCEPTED)
\ No newline at end of file
+        return task_accepted(task, f"Task created to {operation.lower()} {len(items)} users")
\ No newline at end of file
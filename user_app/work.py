@@ -0,0 +1,69 @@
+"""
+Simulated processing time for the user tasks.
+
+The tasks stand in for slower real work with a few steps of artificial
+delay, reporting progress after each step. How that delay is spent is the
+work profile, set with USER_TASK_WORK_PROFILE:
+
+    off       no delay at all
+    fixed     USER_TASK_WORK_FIXED_MS per step
+    random    a random duration per step, in the range each task asks for
+    deferred  the random durations, but as countdowns: the task re-queues
+              itself for every step instead of holding its worker slot
+"""
+import random
+import time
+from celery.utils.log import get_task_logger
+from django.conf import settings
+
+logger = get_task_logger(__name__)
+
+WORK_PROFILES = ('off', 'fixed', 'random', 'deferred')
+
+
+def work_profile():
+    profile = settings.USER_TASK_WORK_PROFILE
+    if profile not in WORK_PROFILES:
+        raise ValueError(f"Unknown USER_TASK_WORK_PROFILE {profile!r}, expected one of {WORK_PROFILES}")
+    return profile
+
+
+def _progress(step, steps, final_progress):
+    return int((step / steps) * final_progress)
+
+
+def simulate_work(task_self, steps, seconds, final_progress=100):
+    """
+    Spend the simulated processing time for task_self (a TrackedTask) in
+    `steps` steps of `seconds` (a (low, high) range) each, reporting progress
+    after every step up to final_progress. Returns once the work is done; under the deferred
+    profile it raises Retry to be run again after the next step's countdown.
+    """
+    profile = work_profile()
+    task_id = task_self.request.id
+
+    if profile == 'off':
+        return
+
+    if profile == 'deferred':
+        # Each delivery of the task is one step; request.retries counts the
+        # steps already waited out
+        completed = task_self.request.retries
+        if completed:
+            task_self.progress(_progress(completed, steps, final_progress))
+            logger.info(f"Task {task_id} progress: step {completed}/{steps}")
+        if completed < steps:
+            # Persist progress now; this delivery ends here
+            task_self.flush_progress()
+            raise task_self.retry(countdown=random.uniform(*seconds), max_retries=steps)
+        return
+
+    for step in range(1, steps + 1):
+        if profile == 'fixed':
+            time.sleep(settings.USER_TASK_WORK_FIXED_MS / 1000)
+        else:
+            time.sleep(random.uniform(*seconds))
+
+        # Update progress; the reporter coalesces database and Celery writes
+        task_self.progress(_progress(step, steps, final_progress))
+        logger.info(f"Task {task_id} progress: step {step}/{steps}")